@@ -3,50 +3,330 @@ Multi-Agent Orchestrator
 Decides which agent/function to call based on conversation state
 """
 
+import asyncio
 import json
 import logging
-from datetime import datetime
-from typing import Dict, Optional, Tuple
-from enum import Enum
+import re
+import string
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from enum import IntEnum
+from functools import lru_cache
+from itertools import combinations
+
+import aiohttp
+import google.generativeai as genai
+import numpy as np
+from google.generativeai import caching
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from backend_tool_classifier import BackendToolClassifier
+from settings import settings
+from system_prompt_config import get_system_prompt
 
 logger = logging.getLogger(__name__)
 
+# Max users whose product lists are kept in memory (LRU; older entries fall back to MongoDB)
+CACHED_PRODUCTS_MAX_USERS = 512
+
+# Max products kept in the shared catalog (LRU; misses are refetched from the products collection)
+PRODUCT_CATALOG_MAX_ENTRIES = 4096
+
+# Seconds to remember that MongoDB had no product cache for a user (negative cache)
+PRODUCT_CACHE_MISS_TTL = 60
+PRODUCT_CACHE_MISS_MAX_ENTRIES = 4096
+
+# Number of stripes for per-user state/order dicts (must be a power of two)
+STATE_SHARD_COUNT = 16
+
+# Max released OrderData objects kept for reuse
+ORDER_POOL_MAX_SIZE = 256
+
+# General-chat system prompt is served from a Gemini context cache shared by all users;
+# the server-side TTL is extended every CHAT_PROMPT_CACHE_REFRESH seconds (also the retry
+# interval after a failed create)
+CHAT_PROMPT_CACHE_TTL = timedelta(minutes=30)
+CHAT_PROMPT_CACHE_REFRESH = 600
+CHAT_PROMPT_CACHE_NAME = "watchvine_chat_prompt_cache"
+
+# Reply cache for short chit-chat messages ("hi", "price?", "available?"): exact match on the
+# normalized text first, then nearest neighbour by embedding cosine similarity
+CHAT_CACHE_MAX_ENTRIES = 1024
+CHAT_CACHE_TTL = 900
+CHAT_CACHE_SIMILARITY = 0.9
+CHAT_CACHE_MAX_MESSAGE_CHARS = 120  # Longer messages are too specific to be worth an embedding call
+CHAT_EMBEDDING_MODEL = "models/gemini-embedding-001"
+
+# General-chat generation: fastest Flash tier by default (google_model env overrides) and a reply
+# budget sized for short WhatsApp answers; Gujarati runs several tokens per word, hence not lower
+CHAT_DEFAULT_MODEL = "gemini-2.5-flash-lite"
+CHAT_MAX_OUTPUT_TOKENS = 512
+_CHAT_STOP_SEQUENCES = ["\nUSER:", "\nASSISTANT:"]  # Stop before the model writes the next turn itself
+
+# Chat generation goes straight to the Gemini REST API over one pooled keep-alive session
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+CHAT_HTTP_MAX_CONNECTIONS = 64
+
+# Number of recent turns included in the general-chat prompt
+CHAT_HISTORY_TURNS = 10
+
+# REST generationConfig payload for chat calls
+_CHAT_GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "maxOutputTokens": CHAT_MAX_OUTPUT_TOKENS,
+    "candidateCount": 1,
+    "stopSequences": _CHAT_STOP_SEQUENCES,
+    "responseMimeType": "text/plain"
+}
+
+# Upper bound on how long a webhook thread waits for a general-chat reply
+CHAT_RESPONSE_TIMEOUT = 60
+
+_CHAT_FALLBACK_REPLY = "Hello! How can I help you today? 😊\n\nI can help you:\n🔍 Find watches\n📦 Browse products\n💬 Answer questions"
+# Bare greetings get a fixed welcome (per system prompt: greet warmly, Gujarati in English font)
+# without a Gemini call; keys are normalized messages
+_STOCK_GREETING_REPLY = (
+    "Kem cho! Welcome to WatchVine! 😊\n\n"
+    "Watches, bags, sunglasses, shoes - tamne shu joie chhe?"
+)
+_STOCK_REPLIES = {
+    greeting: _STOCK_GREETING_REPLY
+    for greeting in (
+        'hi', 'hii', 'hello', 'hey', 'helo', 'namaste', 'namaskar', 'kem cho', 'kem chho',
+        'jay shree krishna', 'jai shree krishna', 'નમસ્તે', 'કેમ છો', 'good morning', 'good evening'
+    )
+}
+STOCK_REPLY_MAX_CHARS = 40
+
+_CHAT_SEPARATOR = "\n\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
+_CHAT_SYSTEM_PROMPT = get_system_prompt()  # Static; built once instead of per message
+_CHAT_PROMPT_PREFIX = _CHAT_SYSTEM_PROMPT + _CHAT_SEPARATOR  # Used when the context cache is unavailable
+
+# Order-collection replies ($url_line is empty when no product URL is known)
+_ASK_NAME_WITH_PRODUCT_TMPL = string.Template("""✅ સરસ! તમે ઓર્ડર કરવા માંગો છો / Great! You want to order:
+
+📦 $product
+$url_line
+
+મહેરબાની કરીને તમારું નામ આપો.
+Please provide your name.""")
+
+_ASK_NAME_MSG = "મહેરબાની કરીને તમારું નામ આપો.\n\nPlease provide your name."
+ASK_ADDRESS_MSG = "તમારું સરનામું શું છે?\n\nPlease provide your delivery address."
+ASK_CORRECTIONS_MSG = "કૃપા કરીને સુધારેલી વિગતો આપો.\n\nPlease provide the corrected details."
+ORDER_SAVE_FAILED_MSG = "માફ કરશો, ઓર્ડર સેવ કરવામાં સમસ્યા આવી.\n\nSorry, there was an issue saving your order. Please try again."
+
+_ORDER_SUMMARY_TMPL = string.Template("""✅ તમારા ઓર્ડરની વિગતો / Your Order Details:
+
+📦 Product: $product
+$url_line
+👤 Name: $name
+📱 Phone: $phone
+📍 Address: $address
+
+શું તમે આ ઓર્ડર કન્ફર્મ કરવા માંગો છો?
+Do you want to confirm this order?
+
+Type "yes" to confirm or provide corrections.""")
+
+# Precompiled patterns (use word boundaries to avoid matching 'hi' in 'this' or 'hey' in 'they')
+_GREETING_RE = re.compile(
+    r'\b(?:hello|hi|hey|namaste|good morning|good afternoon|good evening|hola)\b',
+    re.IGNORECASE
+)
+_URL_RE = re.compile(r'(https?://[^\s]+)')
+_PHONE_RE = re.compile(r'[\d\s\-\+]{10,}')
+_EMAIL_RE = re.compile(r'[\w.\-]+@[\w.\-]+\.\w+')
+_DIGIT_RE = re.compile(r'\d+')
+_WORD_RE = re.compile(r'\w+')
+_STRIP_DIGITS = str.maketrans('', '', '0123456789')
+_CHAT_NORMALIZE_RE = re.compile(r'[^\w\s\u0900-\u097F\u0A80-\u0AFF]+|\s+')  # Keeps Devanagari/Gujarati vowel signs
 
-class ConversationState(Enum):
-    """Conversation states"""
-    GREETING = "greeting"
-    PRODUCT_INQUIRY = "product_inquiry"
-    BROWSING = "browsing"
-    PRODUCT_SELECTED = "product_selected"
-    AWAITING_CONFIRMATION = "awaiting_confirmation"
-    COLLECTING_DETAILS = "collecting_details"
-    DETAILS_COLLECTED = "details_collected"
-    AWAITING_FINAL_CONFIRMATION = "awaiting_final_confirmation"
-    ORDER_PLACED = "order_placed"
-    COMPLETED = "completed"
+# "Label: value" order details, e.g. "*Customer Name:* Amit", "- Contact number: 98...", and several
+# per line ("My name is Ravi, phone: 98..."); a label's value runs up to the next label on its line
+_ORDER_LABELS = r'product[ \t]+name|name|phone|mobile|number|email|address|quantity'
+_ORDER_DETAIL_RE = re.compile(
+    rf'\b(?P<key>{_ORDER_LABELS})\b(?:[ \t]+(?:{_ORDER_LABELS})\b)*'  # "Phone Number" is one label
+    rf'(?:(?!\b(?:{_ORDER_LABELS})\b)[^:\n]){{0,20}}:',
+    re.IGNORECASE
+)
+_ORDER_DETAIL_FIELDS = {
+    'product name': 'product_name',
+    'name': 'customer_name',
+    'phone': 'phone_number',
+    'mobile': 'phone_number',
+    'number': 'phone_number',
+    'email': 'email',
+    'address': 'address',
+    'quantity': 'quantity',
+}
 
+# Prefixes stripped from "buy" messages (lowercase; longer phrases first - order matters!)
+_PRODUCT_NAME_PREFIXES = ('i want to buy this', 'i am interested in', 'i want to buy', 'check out', 'buy')
+_ORDER_MESSAGE_PREFIXES = ('i want to buy', 'i want', 'buy', 'order', 'mane joiye', 'joiye')
 
+# Whole-word confirmation tokens ("yes please" matches via "yes")
+_CONFIRM_WORDS = frozenset({
+    'yes', 'confirm', 'conform', 'ha', 'haan', 'ok', 'okay', 'sure', 'proceed',
+    'continue', 'correct', 'right', 'yup', 'yeah', 'yep'
+})
+
+
+_chat_loop: Optional[asyncio.AbstractEventLoop] = None
+_chat_loop_lock = threading.Lock()
+
+
+def _get_chat_loop() -> asyncio.AbstractEventLoop:
+    """
+    Background event loop for async Gemini calls, started on first use.
+    One long-lived loop so the SDK's async client stays bound to the same loop.
+    """
+    global _chat_loop
+    if _chat_loop is None:
+        with _chat_loop_lock:
+            if _chat_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="orchestrator-chat", daemon=True).start()
+                _chat_loop = loop
+    return _chat_loop
+
+
+def render_history_line(role: str, content: str) -> str:
+    """One conversation turn as it appears in the general-chat prompt"""
+    return f"{'USER' if role == 'user' else 'ASSISTANT'}: {content}\n"
+
+
+@lru_cache(maxsize=4096)
+def _stock_reply(message: str) -> Optional[str]:
+    """Canned reply for a stock phrase, keyed on the lowercased, stripped message"""
+    return _STOCK_REPLIES.get(_CHAT_NORMALIZE_RE.sub(' ', message).strip())
+
+
+def _strip_if_padded(text: str) -> str:
+    """strip() only when there is surrounding whitespace (model replies usually have none)"""
+    if text[:1].isspace() or text[-1:].isspace():
+        return text.strip()
+    return text
+
+
+def _strip_prefix(text: str, prefixes: tuple) -> str:
+    """Remove the first matching prefix (case-insensitive) from text"""
+    text_lower = text.lower()
+    # Single C-level check for the common no-prefix case
+    if not text_lower.startswith(prefixes):
+        return text
+    prefix_len = next(len(p) for p in prefixes if text_lower.startswith(p))
+    return text[prefix_len:].strip()
+
+
+class ConversationState(IntEnum):
+    """Conversation states (int-valued; start at 1 so every state is truthy)"""
+    GREETING = 1
+    PRODUCT_INQUIRY = 2
+    BROWSING = 3
+    PRODUCT_SELECTED = 4
+    AWAITING_CONFIRMATION = 5
+    COLLECTING_DETAILS = 6
+    DETAILS_COLLECTED = 7
+    AWAITING_FINAL_CONFIRMATION = 8
+    ORDER_PLACED = 9
+    COMPLETED = 10
+
+
+# Readable state names for logging, e.g. "collecting_details"
+STATE_NAMES = {state: state.name.lower() for state in ConversationState}
+
+
+# Required order details ('product' = product_name or product_url)
+_REQUIRED_ORDER_FIELDS = ('customer_name', 'address', 'phone_number', 'product')
+
+
+def _order_step(missing: frozenset) -> str:
+    """Next order-collection step for a set of missing fields (name first, then address)"""
+    if 'customer_name' in missing:
+        return '_ask_customer_name'
+    if 'address' in missing:
+        return '_ask_address'
+    if not missing:
+        return '_ask_order_confirmation'
+    return '_ask_missing_details'
+
+
+# Every possible missing-field set -> collector method name
+_ORDER_STEPS = {
+    frozenset(missing): _order_step(frozenset(missing))
+    for size in range(len(_REQUIRED_ORDER_FIELDS) + 1)
+    for missing in combinations(_REQUIRED_ORDER_FIELDS, size)
+}
+
+
+@dataclass(slots=True)
 class OrderData:
     """Order data structure"""
-    def __init__(self):
-        self.customer_name: Optional[str] = None
-        self.phone_number: Optional[str] = None
-        self.email: Optional[str] = None
-        self.address: Optional[str] = None
-        self.product_name: Optional[str] = None
-        self.product_url: Optional[str] = None
-        self.quantity: int = 1
-        self.order_id: Optional[str] = None
-        self.timestamp: Optional[str] = None
+    customer_name: Optional[str] = None
+    phone_number: Optional[str] = None
+    email: Optional[str] = None
+    address: Optional[str] = None
+    product_name: Optional[str] = None
+    product_url: Optional[str] = None
+    quantity: int = 1
+    order_id: Optional[str] = None
+    timestamp: Optional[str] = None
+    
+    def missing_fields(self) -> frozenset:
+        """Required fields still empty (see _REQUIRED_ORDER_FIELDS)"""
+        missing = []
+        if not self.customer_name:
+            missing.append('customer_name')
+        if not self.address:
+            missing.append('address')
+        if not self.phone_number:
+            missing.append('phone_number')
+        if not (self.product_name or self.product_url):
+            missing.append('product')
+        return frozenset(missing)
+    
+    def ask_name_message(self) -> str:
+        """Ask-for-name reply, including the product when one is known"""
+        if self.product_name:
+            return _ASK_NAME_WITH_PRODUCT_TMPL.substitute(
+                product=self.product_name,
+                url_line=f'🔗 {self.product_url}' if self.product_url else ''
+            )
+        return _ASK_NAME_MSG
+    
+    def summary_message(self) -> str:
+        """Order summary asking the user to confirm"""
+        return _ORDER_SUMMARY_TMPL.substitute(
+            product=self.product_name or 'N/A',
+            url_line=f'🔗 URL: {self.product_url}' if self.product_url else '',
+            name=self.customer_name,
+            phone=self.phone_number,
+            address=self.address
+        )
+    
+    def reset(self):
+        """Clear all fields so the instance can be reused"""
+        self.customer_name = None
+        self.phone_number = None
+        self.email = None
+        self.address = None
+        self.product_name = None
+        self.product_url = None
+        self.quantity = 1
+        self.order_id = None
+        self.timestamp = None
     
     def is_complete(self) -> bool:
         """Check if all required fields are filled"""
-        return all([
-            self.customer_name,
-            self.phone_number,
-            self.address,
-            self.product_name or self.product_url
-        ])
+        return not self.missing_fields()
     
     def to_dict(self) -> dict:
         """Convert to dictionary"""
@@ -65,31 +345,178 @@ class OrderData:
         }
 
 
+class ChatResponseCache:
+    """
+    Bounded in-process cache of general-chat replies.
+    Replies are shaped by the user's own history, so entries are scoped to one user and the
+    previous assistant turn (compared exactly). Within that scope a message matches on its
+    normalized text, or by embedding similarity of the message alone.
+    """
+    
+    def __init__(self, max_entries: int = CHAT_CACHE_MAX_ENTRIES, ttl: float = CHAT_CACHE_TTL,
+                 threshold: float = CHAT_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        # (context, message) -> (unit embedding or None, reply, monotonic expiry); ordered oldest-first for LRU eviction
+        self._entries: "OrderedDict[tuple, Tuple[Optional[np.ndarray], str, float]]" = OrderedDict()
+        self._by_context: Dict[tuple, set] = {}  # context -> keys of its entries
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(phone_number: str, user_message: str, conversation_history: list) -> Optional[tuple]:
+        """
+        Cache key for a chat turn as ((phone_number, previous assistant reply), normalized message),
+        or None when the message is too long to cache
+        """
+        if len(user_message) > CHAT_CACHE_MAX_MESSAGE_CHARS:
+            return None
+        message = _CHAT_NORMALIZE_RE.sub(' ', user_message.lower()).strip()
+        if not message:
+            return None
+        previous_reply = next(
+            (msg.get('content', '') for msg in reversed(conversation_history) if msg.get('role') != 'user'),
+            ''
+        )
+        return (phone_number, previous_reply), message
+    
+    def get_exact(self, key: tuple) -> Optional[str]:
+        """Reply stored under exactly this key"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def has_candidates(self, context: tuple) -> bool:
+        """Whether any entry in this context could be matched by similarity"""
+        with self._lock:
+            return any(self._entries[key][0] is not None for key in self._by_context.get(context, ()))
+    
+    def get_similar(self, context: tuple, vector: np.ndarray) -> Optional[str]:
+        """Reply in this context whose message embedding is closest to vector, if above the threshold"""
+        with self._lock:
+            keys = [key for key in self._by_context.get(context, ()) if self._entries[key][0] is not None]
+            if not keys:
+                return None
+            scores = np.vstack([self._entries[key][0] for key in keys]) @ vector
+            
+            # Best first, skipping (and dropping) expired entries
+            now = time.monotonic()
+            for i in np.argsort(scores)[::-1]:
+                if scores[i] < self.threshold:
+                    return None
+                key = keys[i]
+                entry = self._entries[key]
+                if entry[2] < now:
+                    self._drop(key)
+                    continue
+                self._entries.move_to_end(key)
+                return entry[1]
+            return None
+    
+    def put(self, key: tuple, vector: Optional[np.ndarray], reply: str):
+        """Store a reply, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = (vector, reply, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            self._by_context.setdefault(key[0], set()).add(key)
+            if len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+    
+    def _drop(self, key: tuple):
+        """Remove an entry (caller holds the lock)"""
+        if self._entries.pop(key, None) is not None:
+            keys = self._by_context.get(key[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_context[key[0]]
+
+
 class AgentOrchestrator:
     """
     Orchestrator that decides which action to take based on conversation state
     """
     
-    def __init__(self, conversation_manager):
+    def __init__(self, conversation_manager, product_collection=None):
+        """
+        Args:
+            conversation_manager: ConversationManager (conversations + product_cache storage)
+            product_collection: Products collection used to refetch catalog misses by URL (optional)
+        """
         self.conversation_manager = conversation_manager
-        self.user_states: Dict[str, ConversationState] = {}
-        self.user_orders: Dict[str, OrderData] = {}
-        self.cached_products: Dict[str, list] = {}  # Cache product data for "more images" requests
+        self.product_collection = product_collection
+        # Pagination context lives in its own collection keyed by _id = phone_number
+        # (kept out of `conversations` so history queries don't see sentinel rows)
+        self._search_ctx = conversation_manager.db.search_context
+        # Per-user state and orders, striped by hash(phone_number) so each dict stays small;
+        # compound updates take only the lock of the shard they touch
+        self._state_shards: List[Dict[str, ConversationState]] = [{} for _ in range(STATE_SHARD_COUNT)]
+        self._order_shards: List[Dict[str, OrderData]] = [{} for _ in range(STATE_SHARD_COUNT)]
+        self._shard_locks: List[threading.Lock] = [threading.Lock() for _ in range(STATE_SHARD_COUNT)]
+        self._order_pool: List[OrderData] = []  # Released OrderData objects for reuse
+        self._order_pool_lock = threading.Lock()  # Pool is shared by all shards
+        self.cached_products: "OrderedDict[str, list]" = OrderedDict()  # LRU cache of product data for "more images" requests
+        self._classifier: Optional[BackendToolClassifier] = None  # Created lazily on first message
+        self._cache_miss_ts: Dict[str, float] = {}  # phone -> monotonic time of last MongoDB miss
+        # LRU product store keyed by product ID (URL, else str(_id)); product_cache holds IDs only
+        self.product_catalog: "OrderedDict[str, dict]" = OrderedDict()
+        self._catalog_lock = threading.Lock()
+        
+        # General chat (SDK configured once by settings; generation calls go over REST)
+        self._chat_model_name = settings.google_model or CHAT_DEFAULT_MODEL
+        self._chat_generate_url = (
+            f"{GEMINI_API_BASE}/models/{self._chat_model_name.removeprefix('models/')}:generateContent"
+        )
+        self._chat_http: Optional[aiohttp.ClientSession] = None  # Created on the chat loop at first use
+        # model name -> (CachedContent, monotonic time of last create/refresh)
+        self._chat_prompt_caches: Dict[str, tuple] = {}
+        self._chat_cache_tasks: Dict[str, asyncio.Task] = {}  # model name -> running create/refresh
+        self._chat_responses = ChatResponseCache()
+        self._chat_embed_tasks: set = set()  # Background embeddings of cached replies (strong refs)
+        # Missing-field set -> bound collector, so order collection routes with one dict lookup
+        self._order_collectors = {missing: getattr(self, step) for missing, step in _ORDER_STEPS.items()}
+    
+    @staticmethod
+    def _shard_index(phone_number: str) -> int:
+        """Shard slot for a user"""
+        return hash(phone_number) & (STATE_SHARD_COUNT - 1)
     
     def get_user_state(self, phone_number: str) -> ConversationState:
         """Get current conversation state for user"""
-        return self.user_states.get(phone_number, ConversationState.GREETING)
+        return self._state_shards[self._shard_index(phone_number)].get(phone_number, ConversationState.GREETING)
     
     def set_user_state(self, phone_number: str, state: ConversationState):
         """Set conversation state for user"""
-        self.user_states[phone_number] = state
-        logger.info(f"📊 State updated for {phone_number}: {state.value}")
+        self._state_shards[self._shard_index(phone_number)][phone_number] = state
+        logger.info("📊 State updated for %s: %s", phone_number, STATE_NAMES.get(state, state))
     
     def get_order_data(self, phone_number: str) -> OrderData:
         """Get order data for user"""
-        if phone_number not in self.user_orders:
-            self.user_orders[phone_number] = OrderData()
-        return self.user_orders[phone_number]
+        # Single dict probe on the (common) hit path
+        idx = self._shard_index(phone_number)
+        orders = self._order_shards[idx]
+        order = orders.get(phone_number)
+        if order is None:
+            with self._shard_locks[idx]:
+                order = orders.get(phone_number)
+                if order is None:
+                    order = orders[phone_number] = self._acquire_order()
+        return order
+    
+    def _acquire_order(self) -> OrderData:
+        """Take a reset OrderData from the pool, or create a new one"""
+        with self._order_pool_lock:
+            order = self._order_pool.pop() if self._order_pool else None
+        if order is None:
+            return OrderData()
+        order.reset()
+        return order
     
     def analyze_message(self, message: str, phone_number: str) -> Tuple[str, dict]:
         """
@@ -99,7 +526,7 @@ class AgentOrchestrator:
             Tuple of (action, metadata)
             Actions: 'ai_response', 'save_order_direct'
         """
-        logger.info(f"📨 Analyzing message from {phone_number}")
+        logger.info("📨 Analyzing message from %s", phone_number)
         
         # Get conversation history
         conversation_history = self.conversation_manager.get_history(phone_number)
@@ -107,107 +534,115 @@ class AgentOrchestrator:
         # Get search context for pagination (if exists)
         search_context = self.get_search_context(phone_number)
         
-        # Use backend tool classifier with Gemini
-        from enhanced_backend_tool_classifier import BackendToolClassifier
-        classifier = BackendToolClassifier()
+        # Use backend tool classifier with Gemini (reused across messages)
+        if self._classifier is None:
+            self._classifier = BackendToolClassifier()
         
         # Classify the message (pass search context for pagination)
-        decision = classifier.analyze_and_classify(conversation_history, message, phone_number, search_context)
+        decision = self._classifier.analyze_and_classify(conversation_history, message, phone_number, search_context)
         
         tool = decision.get('tool', 'ai_chat')
         
-        logger.info(f"🔧 Backend Tool Classifier Decision: {tool}")
-        
-        if tool == 'show_more':
-            # AI detected user wants to see more from current search
-            logger.info(f"🔄 Backend AI detected: User wants to see more products")
-            return ('show_more', {})
-        
-        elif tool == 'find_product':
-            # Backend AI detected product search and extracted keyword + range + category_key
-            keyword = decision.get('keyword', '')
-            range_str = decision.get('range', '0-10')
-            category_key = decision.get('category_key')  # Pass category_key for filtering
-            min_price = decision.get('min_price')
-            max_price = decision.get('max_price')
-            logger.info(f"🔍 Backend AI extracted product keyword: '{keyword}'")
-            logger.info(f"📂 Backend AI detected category_key: '{category_key}'")
-            logger.info(f"📊 Backend AI provided range: '{range_str}'")
-            return ('find_product', {
-                'keyword': keyword, 
-                'range': range_str, 
-                'category_key': category_key,
-                'min_price': min_price,
-                'max_price': max_price
-            })
-        
-        elif tool == 'find_product_by_range':
-            # Backend AI detected price range search and extracted min/max price + category
-            category = decision.get('category', 'watches')
-            min_price = decision.get('min_price')
-            max_price = decision.get('max_price')
-            product_name = decision.get('product_name', f"₹{min_price}-₹{max_price} {category}")
-            logger.info(f"💰 Backend AI detected PRICE RANGE search")
-            logger.info(f"📦 Category: {category} | Price Range: ₹{min_price} - ₹{max_price}")
-            logger.info(f"🛍️ Product Name: {product_name}")
-            return ('find_product_by_range', {
-                'category': category,
-                'min_price': min_price,
-                'max_price': max_price,
-                'product_name': product_name
-            })
-        
-        elif tool == 'ask_product_for_images':
-            # User wants more images but didn't specify which product
-            logger.info(f"📸 Backend AI detected: User wants more images (no product specified)")
-            return ('ask_product_for_images', {})
-        
-        elif tool == 'send_all_images':
-            # User wants all images for specific product
-            product_name = decision.get('product_name', '')
-            logger.info(f"📸 Backend AI detected: User wants all images for '{product_name}'")
-            return ('send_all_images', {'product_name': product_name})
-        
-        elif tool == 'show_all_cached_images':
-            # User wants to see all images from recent search
-            logger.info(f"📸 Backend AI detected: User wants all images for all recent products")
-            return ('show_all_cached_images', {})
-        
-        elif tool == 'show_category_products':
-            # User wants to see products from a category
-            logger.info(f"📂 Backend AI detected: User wants to see all products from category")
-            return ('show_category_products', {})
-        
-        elif tool == 'ask_category_selection':
-            # User asked for generic product without specifying gender/category
-            product_type = decision.get('product_type', 'watch')
-            logger.info(f"📋 Backend AI detected: Generic product request, need category selection for {product_type}")
-            return ('ask_category_selection', {'product_type': product_type})
-        
-        elif tool == 'save_data_to_google_sheet':
-            # Backend AI detected order confirmation with complete validated data
-            order_data = decision.get('data', {})
-            logger.info(f"💾 Backend AI extracted complete order data for saving")
-            logger.info(f"📦 Product: {order_data.get('product_name', 'N/A')}")
-            logger.info(f"👤 Customer: {order_data.get('name', 'N/A')}")
-            logger.info(f"📱 Phone: {order_data.get('phone', 'N/A')}")
-            return ('save_order_direct', {'order_data': order_data})
-        
-        else:
-            # Default: Let chat AI respond
-            return ('ai_response', {'intent': 'general_query'})
+        logger.info("🔧 Backend Tool Classifier Decision: %s", tool)
+        
+        handler = self._TOOL_HANDLERS.get(tool, AgentOrchestrator._handle_ai_response)
+        return handler(self, decision)
+    
+    def _handle_show_more(self, decision: dict) -> Tuple[str, dict]:
+        """AI detected user wants to see more from current search"""
+        logger.info("🔄 Backend AI detected: User wants to see more products")
+        return ('show_more', {})
+    
+    def _handle_find_product(self, decision: dict) -> Tuple[str, dict]:
+        """Backend AI detected product search and extracted keyword + range + category_key"""
+        keyword = decision.get('keyword', '')
+        range_str = decision.get('range', '0-10')
+        category_key = decision.get('category_key')  # Pass category_key for filtering
+        min_price = decision.get('min_price')
+        max_price = decision.get('max_price')
+        logger.info("🔍 Backend AI extracted product keyword: '%s'", keyword)
+        logger.info("📂 Backend AI detected category_key: '%s'", category_key)
+        logger.info("📊 Backend AI provided range: '%s'", range_str)
+        return ('find_product', {
+            'keyword': keyword, 
+            'range': range_str, 
+            'category_key': category_key,
+            'min_price': min_price,
+            'max_price': max_price
+        })
+    
+    def _handle_find_product_by_range(self, decision: dict) -> Tuple[str, dict]:
+        """Backend AI detected price range search and extracted min/max price + category"""
+        category = decision.get('category', 'watches')
+        min_price = decision.get('min_price')
+        max_price = decision.get('max_price')
+        product_name = decision.get('product_name', f"₹{min_price}-₹{max_price} {category}")
+        logger.info("💰 Backend AI detected PRICE RANGE search")
+        logger.info("📦 Category: %s | Price Range: ₹%s - ₹%s", category, min_price, max_price)
+        logger.info("🛍️ Product Name: %s", product_name)
+        return ('find_product_by_range', {
+            'category': category,
+            'min_price': min_price,
+            'max_price': max_price,
+            'product_name': product_name
+        })
+    
+    def _handle_ask_product_for_images(self, decision: dict) -> Tuple[str, dict]:
+        """User wants more images but didn't specify which product"""
+        logger.info("📸 Backend AI detected: User wants more images (no product specified)")
+        return ('ask_product_for_images', {})
+    
+    def _handle_send_all_images(self, decision: dict) -> Tuple[str, dict]:
+        """User wants all images for specific product"""
+        product_name = decision.get('product_name', '')
+        logger.info("📸 Backend AI detected: User wants all images for '%s'", product_name)
+        return ('send_all_images', {'product_name': product_name})
+    
+    def _handle_show_all_cached_images(self, decision: dict) -> Tuple[str, dict]:
+        """User wants to see all images from recent search"""
+        logger.info("📸 Backend AI detected: User wants all images for all recent products")
+        return ('show_all_cached_images', {})
+    
+    def _handle_show_category_products(self, decision: dict) -> Tuple[str, dict]:
+        """User wants to see products from a category"""
+        logger.info("📂 Backend AI detected: User wants to see all products from category")
+        return ('show_category_products', {})
+    
+    def _handle_ask_category_selection(self, decision: dict) -> Tuple[str, dict]:
+        """User asked for generic product without specifying gender/category"""
+        product_type = decision.get('product_type', 'watch')
+        logger.info("📋 Backend AI detected: Generic product request, need category selection for %s", product_type)
+        return ('ask_category_selection', {'product_type': product_type})
+    
+    def _handle_save_order(self, decision: dict) -> Tuple[str, dict]:
+        """Backend AI detected order confirmation with complete validated data"""
+        order_data = decision.get('data', {})
+        logger.info("💾 Backend AI extracted complete order data for saving")
+        logger.info("📦 Product: %s", order_data.get('product_name', 'N/A'))
+        logger.info("👤 Customer: %s", order_data.get('name', 'N/A'))
+        logger.info("📱 Phone: %s", order_data.get('phone', 'N/A'))
+        return ('save_order_direct', {'order_data': order_data})
+    
+    def _handle_ai_response(self, decision: dict) -> Tuple[str, dict]:
+        """Default: Let chat AI respond"""
+        return ('ai_response', {'intent': 'general_query'})
+    
+    # Classifier tool -> handler, built once at class creation
+    _TOOL_HANDLERS = {
+        'show_more': _handle_show_more,
+        'find_product': _handle_find_product,
+        'find_product_by_range': _handle_find_product_by_range,
+        'ask_product_for_images': _handle_ask_product_for_images,
+        'send_all_images': _handle_send_all_images,
+        'show_all_cached_images': _handle_show_all_cached_images,
+        'show_category_products': _handle_show_category_products,
+        'ask_category_selection': _handle_ask_category_selection,
+        'save_data_to_google_sheet': _handle_save_order,
+    }
     
     def _is_greeting(self, message: str) -> bool:
         """Check if message is a greeting"""
-        import re
-        greetings = ['hello', 'hi', 'hey', 'namaste', 'good morning', 
-                    'good afternoon', 'good evening', 'hola']
-        # Use word boundaries to avoid matching 'hi' in 'this' or 'hey' in 'they'
-        for greeting in greetings:
-            # Check if greeting appears as a whole word
-            if re.search(r'\b' + re.escape(greeting) + r'\b', message, re.IGNORECASE):
-                return True
-        return False
+        return _GREETING_RE.search(message) is not None
     
     def _is_product_url(self, message: str) -> bool:
         """Check if message contains product URL"""
@@ -215,41 +650,22 @@ class AgentOrchestrator:
     
     def _extract_product_url(self, message: str) -> str:
         """Extract product URL from message"""
-        import re
-        url_pattern = r'(https?://[^\s]+)'
-        match = re.search(url_pattern, message)
+        match = _URL_RE.search(message)
         return match.group(1) if match else ''
     
     def _extract_product_name(self, message: str) -> str:
         """Extract product name from message (sent via WhatsApp button)"""
-        # Product name usually comes before the URL
-        parts = message.split('http')
-        if len(parts) > 1:
-            # Get the text before the URL
-            text_before_url = parts[0].strip()
-            
-            # Remove common prefixes (case-insensitive)
-            # Order matters - check longer phrases first!
-            prefixes_to_remove = [
-                'i want to buy this',
-                'I want to buy this',
-                'i am interested in',
-                'I am interested in',
-                'i want to buy',
-                'I want to buy',
-                'check out',
-                'Check out',
-                'buy',
-                'Buy'
-            ]
+        # Product name usually comes before the URL (one regex pass gives both)
+        url_match = _URL_RE.search(message)
+        if not url_match:
+            return ''
+        
+        # Get the text before the URL
+        text_before_url = message[:url_match.start()].strip()
+        if text_before_url:
             
             # Try to remove any matching prefix (case-insensitive)
-            name = text_before_url
-            for prefix in prefixes_to_remove:
-                if text_before_url.lower().startswith(prefix.lower()):
-                    # Remove the prefix
-                    name = text_before_url[len(prefix):].strip()
-                    break
+            name = _strip_prefix(text_before_url, _PRODUCT_NAME_PREFIXES)
             
             # If we have a valid product name after removing prefix, return it
             if name and len(name) > 2 and name.lower() != text_before_url.lower():
@@ -257,106 +673,98 @@ class AgentOrchestrator:
         
         # Fallback: Try to extract product name from URL
         # e.g., https://watchvine01.cartpe.in/products/rolex-watch
-        url = self._extract_product_url(message)
-        if url:
-            # Extract from URL path
-            try:
-                from urllib.parse import urlparse
-                parsed = urlparse(url)
-                path_parts = parsed.path.strip('/').split('/')
-                if len(path_parts) > 0:
-                    # Get last part of path and clean it up
-                    product_slug = path_parts[-1]
-                    # Remove .html, .php, etc.
-                    product_slug = product_slug.split('.')[0]
-                    # Convert slug to readable name (e.g., rolex-watch -> Rolex Watch)
-                    name = product_slug.replace('-', ' ').replace('_', ' ').title()
-                    if name and len(name) > 2:
-                        return name
-            except Exception as e:
-                logger.warning(f"Could not extract product name from URL: {e}")
+        try:
+            parsed = urlparse(url_match.group(1))
+            path_parts = parsed.path.strip('/').split('/')
+            if len(path_parts) > 0:
+                # Get last part of path and clean it up
+                product_slug = path_parts[-1]
+                # Remove .html, .php, etc.
+                product_slug = product_slug.split('.')[0]
+                # Convert slug to readable name (e.g., rolex-watch -> Rolex Watch)
+                name = product_slug.replace('-', ' ').replace('_', ' ').title()
+                if name and len(name) > 2:
+                    return name
+        except Exception as e:
+            logger.warning(f"Could not extract product name from URL: {e}")
         
         return ''
     
     def _is_confirmation(self, message: str) -> bool:
         """Check if message is a confirmation"""
-        confirmations = ['yes', 'confirm', 'conform', 'ha', 'haan', 'ok', 'okay', 
-                        'sure', 'proceed', 'continue', 'yes please', 'correct', 
-                        'right', 'yup', 'yeah', 'yep']
-        return any(conf in message for conf in confirmations)
+        return not _CONFIRM_WORDS.isdisjoint(_WORD_RE.findall(message.lower()))
+    
+    @staticmethod
+    def _iter_order_details(message: str):
+        """(OrderData field, raw value) for each labelled detail in message"""
+        for line in message.splitlines():
+            matches = list(_ORDER_DETAIL_RE.finditer(line))
+            for i, match in enumerate(matches):
+                end = matches[i + 1].start() if i + 1 < len(matches) else len(line)
+                # Only "product name" can have irregular inner whitespace, so any unknown key is that one
+                field = _ORDER_DETAIL_FIELDS.get(match.group('key').lower(), 'product_name')
+                yield field, line[match.end():end].strip(' \t*-,;')
     
     def _extract_order_details(self, message: str, order_data: OrderData, phone_number: str) -> bool:
         """
         Extract order details from message
         Returns True if new details were extracted
         """
-        import re
-        
-        # Handle both markdown format and plain text
-        lines = message.split('\n')
-        
-        for line in lines:
-            # Remove markdown formatting (*, **, bullets, etc.)
-            line_clean = line.replace('*', '').replace('-', '').strip()
-            line_lower = line_clean.lower()
+        # Every labelled field on every line (handles both markdown format and plain text)
+        for field, value in self._iter_order_details(message):
+            
+            # Extract quantity (latest value wins)
+            if field == 'quantity':
+                qty_match = _DIGIT_RE.search(value)
+                if qty_match:
+                    order_data.quantity = int(qty_match.group())
+                    logger.info("📝 Extracted quantity: %s", order_data.quantity)
             
-            # Skip empty lines and headers
-            if not line_clean or 'order details' in line_lower:
+            # Other fields keep the first valid value
+            elif getattr(order_data, field):
                 continue
             
-            # Extract name (look for "name:" or "customer name:")
-            if not order_data.customer_name and 'name' in line_lower and ':' in line_clean:
-                name = line_clean.split(':')[-1].strip()
+            elif field == 'customer_name':
                 # Validate: name should be 2+ chars and not contain too many numbers
-                if len(name) > 2 and sum(c.isdigit() for c in name) < len(name) / 2:
-                    order_data.customer_name = name
-                    logger.info(f"📝 Extracted name: {name}")
+                # (isalpha() settles the common all-letters case; translate() counts digits in C)
+                if len(value) > 2 and (value.isalpha() or
+                                       (len(value) - len(value.translate(_STRIP_DIGITS))) * 2 < len(value)):
+                    order_data.customer_name = value
+                    logger.info("📝 Extracted name: %s", value)
             
-            # Extract phone (look for "phone:" or numbers)
-            if not order_data.phone_number and ('phone' in line_lower or 'mobile' in line_lower or 'number' in line_lower):
-                phone_match = re.search(r'[\d\s\-\+]{10,}', line_clean)
+            elif field == 'phone_number':
+                phone_match = _PHONE_RE.search(value)
                 if phone_match:
                     order_data.phone_number = phone_match.group().strip()
-                    logger.info(f"📝 Extracted phone: {order_data.phone_number}")
-            
-            # Extract email
-            if not order_data.email and '@' in line_clean:
-                email_match = re.search(r'[\w\.-]+@[\w\.-]+\.\w+', line_clean)
-                if email_match:
-                    order_data.email = email_match.group()
-                    logger.info(f"📝 Extracted email: {order_data.email}")
+                    logger.info("📝 Extracted phone: %s", order_data.phone_number)
             
-            # Extract address (look for "address:" or long text with address keywords)
-            if not order_data.address and 'address' in line_lower and ':' in line_clean:
-                address = line_clean.split(':')[-1].strip()
-                if len(address) > 10:  # Address should be reasonably long
-                    order_data.address = address
-                    logger.info(f"📝 Extracted address: {address[:50]}...")
+            elif field == 'address':
+                if len(value) > 10:  # Address should be reasonably long
+                    order_data.address = value
+                    logger.info("📝 Extracted address: %s...", value[:50])
             
-            # Extract product name
-            if not order_data.product_name and 'product' in line_lower and 'name' in line_lower and ':' in line_clean:
-                product = line_clean.split(':')[-1].strip()
-                if len(product) > 2:
-                    order_data.product_name = product
-                    logger.info(f"📝 Extracted product name: {product}")
-            
-            # Extract quantity
-            if 'quantity' in line_lower and ':' in line_clean:
-                qty_match = re.search(r'\d+', line_clean.split(':')[-1])
-                if qty_match:
-                    order_data.quantity = int(qty_match.group())
-                    logger.info(f"📝 Extracted quantity: {order_data.quantity}")
+            elif field == 'product_name':
+                if len(value) > 2:
+                    order_data.product_name = value
+                    logger.info("📝 Extracted product name: %s", value)
+        
+        # Extract email (may appear anywhere, labelled or not)
+        if not order_data.email and '@' in message:
+            email_match = _EMAIL_RE.search(message)
+            if email_match:
+                order_data.email = email_match.group()
+                logger.info("📝 Extracted email: %s", order_data.email)
         
         # Fallback: if phone_number not in order, use the one from WhatsApp
         if not order_data.phone_number:
             order_data.phone_number = phone_number
-            logger.info(f"📝 Using WhatsApp phone: {phone_number}")
+            logger.info("📝 Using WhatsApp phone: %s", phone_number)
         
         # Log current status
-        logger.info(f"📊 Order data status - Name: {bool(order_data.customer_name)}, "
-                   f"Phone: {bool(order_data.phone_number)}, "
-                   f"Address: {bool(order_data.address)}, "
-                   f"Complete: {order_data.is_complete()}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("📊 Order data status - Name: %s, Phone: %s, Address: %s, Complete: %s",
+                        bool(order_data.customer_name), bool(order_data.phone_number),
+                        bool(order_data.address), order_data.is_complete())
         
         return True
     
@@ -377,9 +785,7 @@ class AgentOrchestrator:
             Dict with keyword, total_found, sent_count, min_price, max_price, category_key (or empty dict if no context)
         """
         try:
-            context_doc = self.conversation_manager.conversations.find_one(
-                {'phone_number': phone_number, 'role': 'search_context'}
-            )
+            context_doc = self._search_ctx.find_one({'_id': phone_number})
             
             if context_doc:
                 return {
@@ -419,12 +825,12 @@ class AgentOrchestrator:
                 'category_key': category_key,
                 'timestamp': datetime.now()
             }
-            self.conversation_manager.conversations.update_one(
-                {'phone_number': phone_number, 'role': 'search_context'},
+            self._search_ctx.update_one(
+                {'_id': phone_number},
                 {'$set': context},
                 upsert=True
             )
-            logger.info(f"💾 Search context saved: {keyword} ({sent_count}/{total_found}) | Category: {category_key} | Price: ₹{min_price}-₹{max_price}")
+            logger.info("💾 Search context saved: %s (%s/%s) | Category: %s | Price: ₹%s-₹%s", keyword, sent_count, total_found, category_key, min_price, max_price)
         except Exception as e:
             logger.error(f"Error saving search context: {e}")
     
@@ -433,13 +839,16 @@ class AgentOrchestrator:
         try:
             from datetime import datetime, timedelta
             
+            # Register products in the shared catalog; MongoDB only stores their URLs
+            product_ids = self._register_products(products)
+            
             # Store in MongoDB for persistence across restarts
             self.conversation_manager.db.product_cache.update_one(
                 {'phone_number': phone_number},
                 {
                     '$set': {
                         'phone_number': phone_number,
-                        'products': products,
+                        'product_ids': product_ids,
                         'sent_count': 0,  # Track how many products already sent for pagination
                         'timestamp': datetime.now(),
                         'expires_at': datetime.now() + timedelta(hours=24)  # Cache for 24 hours
@@ -449,45 +858,125 @@ class AgentOrchestrator:
             )
             
             # Also keep in memory for faster access
-            self.cached_products[phone_number] = products
-            logger.info(f"💾 Cached {len(products)} products for {phone_number} (MongoDB + Memory)")
+            self._remember_products(phone_number, products)
+            self._cache_miss_ts.pop(phone_number, None)
+            logger.info("💾 Cached %s products for %s (MongoDB + Memory)", len(products), phone_number)
         except Exception as e:
             logger.error(f"Error caching products to MongoDB: {e}")
             # Fallback to memory-only cache
-            self.cached_products[phone_number] = products
-            logger.info(f"💾 Cached {len(products)} products for {phone_number} (Memory only)")
+            self._remember_products(phone_number, products)
+            self._cache_miss_ts.pop(phone_number, None)
+            logger.info("💾 Cached %s products for %s (Memory only)", len(products), phone_number)
+    
+    @staticmethod
+    def _product_id(product: dict) -> Optional[str]:
+        """Catalog ID of a product: its URL, or its MongoDB _id when it has no URL"""
+        url = product.get('url')
+        if url:
+            return url
+        return str(product['_id']) if product.get('_id') is not None else None
+    
+    def _catalog_put(self, product_id: str, product: dict):
+        """Store a product in the catalog, evicting the least recently used one when full (caller holds the lock)"""
+        self.product_catalog[product_id] = product
+        self.product_catalog.move_to_end(product_id)
+        if len(self.product_catalog) > PRODUCT_CATALOG_MAX_ENTRIES:
+            self.product_catalog.popitem(last=False)
+    
+    def _register_products(self, products: list) -> list:
+        """Add products to the shared catalog and return their IDs"""
+        product_ids = []
+        with self._catalog_lock:
+            for product in products:
+                product_id = self._product_id(product)
+                if product_id is None:
+                    logger.warning("⚠️ Product without url or _id not cached: %s", product.get('name', 'N/A'))
+                    continue
+                self._catalog_put(product_id, product)
+                product_ids.append(product_id)
+        return product_ids
+    
+    def _resolve_products(self, product_ids: list) -> list:
+        """Look up products by ID in the catalog, refetching any misses in one query"""
+        found = {}
+        with self._catalog_lock:
+            for pid in product_ids:
+                product = self.product_catalog.get(pid)
+                if product is not None:
+                    self.product_catalog.move_to_end(pid)
+                    found[pid] = product
+        
+        missing = {pid for pid in product_ids if pid not in found}
+        if missing and self.product_collection is not None:
+            urls = [pid for pid in missing if not ObjectId.is_valid(pid)]
+            object_ids = [ObjectId(pid) for pid in missing if ObjectId.is_valid(pid)]
+            query = {'$or': [{'url': {'$in': urls}}, {'_id': {'$in': object_ids}}]}
+            try:
+                fetched = list(self.product_collection.find(query, {'text_embedding': 0}))
+            except Exception as e:
+                logger.error(f"Error refetching products from catalog: {e}")
+                fetched = []
+            with self._catalog_lock:
+                for product in fetched:
+                    for pid in (product.get('url'), str(product['_id'])):
+                        if pid in missing:
+                            found[pid] = product
+                            self._catalog_put(pid, product)
+        return [found[pid] for pid in product_ids if pid in found]
+    
+    def _remember_products(self, phone_number: str, products: list):
+        """Store products in the in-memory LRU cache, evicting the least recently used user"""
+        self.cached_products[phone_number] = products
+        self.cached_products.move_to_end(phone_number)
+        if len(self.cached_products) > CACHED_PRODUCTS_MAX_USERS:
+            self.cached_products.popitem(last=False)
     
     def get_cached_products(self, phone_number: str) -> list:
         """Get cached product data - Check memory first, then MongoDB"""
         # First check in-memory cache
-        if phone_number in self.cached_products:
-            logger.info(f"📦 Found {len(self.cached_products[phone_number])} products in memory cache")
-            return self.cached_products.get(phone_number, [])
+        products = self.cached_products.get(phone_number)
+        if products is not None:
+            self.cached_products.move_to_end(phone_number)
+            logger.info("📦 Found %s products in memory cache", len(products))
+            return products
+        
+        # Skip MongoDB if we already found nothing there recently
+        miss_ts = self._cache_miss_ts.get(phone_number)
+        if miss_ts is not None and time.monotonic() - miss_ts < PRODUCT_CACHE_MISS_TTL:
+            return []
         
-        # If not in memory, check MongoDB
+        # If not in memory, check MongoDB (the TTL index only sweeps about once a minute,
+        # so expired docs are filtered out here too)
         try:
-            from datetime import datetime
-            
             cached_doc = self.conversation_manager.db.product_cache.find_one(
-                {
-                    'phone_number': phone_number,
-                    'expires_at': {'$gt': datetime.now()}  # Not expired
-                }
+                {'phone_number': phone_number, 'expires_at': {'$gt': datetime.now()}},
+                projection={'product_ids': 1, '_id': 0}
             )
             
-            if cached_doc and cached_doc.get('products'):
-                products = cached_doc['products']
+            if cached_doc and cached_doc.get('product_ids'):
+                products = self._resolve_products(cached_doc['product_ids'])
                 # Restore to memory cache for faster future access
-                self.cached_products[phone_number] = products
-                logger.info(f"📦 Found {len(products)} products in MongoDB cache")
+                self._remember_products(phone_number, products)
+                logger.info("📦 Found %s products in MongoDB cache", len(products))
                 return products
             else:
-                logger.info(f"📦 No cached products found in MongoDB for {phone_number}")
+                logger.info("📦 No cached products found in MongoDB for %s", phone_number)
+                self._record_cache_miss(phone_number)
                 return []
         except Exception as e:
             logger.error(f"Error retrieving cached products from MongoDB: {e}")
             return []
     
+    def _record_cache_miss(self, phone_number: str):
+        """Remember a MongoDB product cache miss, pruning expired entries when the map grows large"""
+        now = time.monotonic()
+        if len(self._cache_miss_ts) >= PRODUCT_CACHE_MISS_MAX_ENTRIES:
+            self._cache_miss_ts = {
+                phone: ts for phone, ts in self._cache_miss_ts.items()
+                if now - ts < PRODUCT_CACHE_MISS_TTL
+            }
+        self._cache_miss_ts[phone_number] = now
+    
     def get_next_cached_products(self, phone_number: str, batch_size: int = 5) -> tuple:
         """
         Get next batch of cached products for pagination (show more functionality)
@@ -500,39 +989,32 @@ class AgentOrchestrator:
             Tuple of (next_batch_products, has_more, sent_count, total_count)
         """
         try:
-            from datetime import datetime
-            
-            # Get cached data from MongoDB
-            cached_doc = self.conversation_manager.db.product_cache.find_one(
-                {
-                    'phone_number': phone_number,
-                    'expires_at': {'$gt': datetime.now()}  # Not expired
-                }
+            # Fetch cached data and advance sent_count in a single atomic round trip
+            # (returns the document as it was BEFORE the increment)
+            cached_doc = self.conversation_manager.db.product_cache.find_one_and_update(
+                {'phone_number': phone_number, 'expires_at': {'$gt': datetime.now()}},  # Not expired
+                {'$inc': {'sent_count': batch_size}},
+                projection={'product_ids': 1, 'sent_count': 1, '_id': 0},
+                return_document=ReturnDocument.BEFORE
             )
             
-            if not cached_doc or not cached_doc.get('products'):
+            if not cached_doc or not cached_doc.get('product_ids'):
                 logger.warning(f"⚠️ No cached products for pagination: {phone_number}")
                 return ([], False, 0, 0)
             
-            products = cached_doc['products']
+            product_ids = cached_doc['product_ids']
             sent_count = cached_doc.get('sent_count', 0)
-            total_count = len(products)
+            total_count = len(product_ids)
             
-            # Calculate next batch
-            start_idx = sent_count
+            # Calculate next batch (only this batch is resolved against the catalog)
+            start_idx = min(sent_count, total_count)
             end_idx = min(sent_count + batch_size, total_count)
-            next_batch = products[start_idx:end_idx]
+            next_batch = self._resolve_products(product_ids[start_idx:end_idx])
             
-            # Update sent_count in MongoDB
             new_sent_count = end_idx
-            self.conversation_manager.db.product_cache.update_one(
-                {'phone_number': phone_number},
-                {'$set': {'sent_count': new_sent_count}}
-            )
-            
             has_more = new_sent_count < total_count
             
-            logger.info(f"📄 Pagination: Sending products {start_idx+1}-{end_idx} of {total_count} (has_more={has_more})")
+            logger.info("📄 Pagination: Sending products %s-%s of %s (has_more=%s)", start_idx+1, end_idx, total_count, has_more)
             
             return (next_batch, has_more, new_sent_count, total_count)
             
@@ -542,37 +1024,44 @@ class AgentOrchestrator:
     
     def set_user_context(self, phone_number: str, context: dict):
         """Set temporary context for user (e.g., last category searched)"""
-        if phone_number not in self.user_states:
-            self.user_states[phone_number] = {}
-        # Store context in user_states as a dict
-        if not isinstance(self.user_states[phone_number], dict):
-            self.user_states[phone_number] = {'state': self.user_states[phone_number]}
-        self.user_states[phone_number]['context'] = context
-        logger.info(f"💾 Saved context for {phone_number}: {context}")
+        idx = self._shard_index(phone_number)
+        states = self._state_shards[idx]
+        with self._shard_locks[idx]:
+            if phone_number not in states:
+                states[phone_number] = {}
+            # Store context in user state as a dict
+            if not isinstance(states[phone_number], dict):
+                states[phone_number] = {'state': states[phone_number]}
+            states[phone_number]['context'] = context
+        logger.info("💾 Saved context for %s: %s", phone_number, context)
     
     def get_user_context(self, phone_number: str) -> dict:
         """Get temporary context for user"""
-        if phone_number in self.user_states:
-            if isinstance(self.user_states[phone_number], dict):
-                return self.user_states[phone_number].get('context', {})
+        state = self._state_shards[self._shard_index(phone_number)].get(phone_number)
+        if isinstance(state, dict):
+            return state.get('context', {})
         return {}
     
     def clear_user_data(self, phone_number: str):
         """Clear user data after order completion"""
-        if phone_number in self.user_states:
-            del self.user_states[phone_number]
-        if phone_number in self.user_orders:
-            del self.user_orders[phone_number]
+        idx = self._shard_index(phone_number)
+        with self._shard_locks[idx]:
+            self._state_shards[idx].pop(phone_number, None)
+            order = self._order_shards[idx].pop(phone_number, None)
+        if order is not None:
+            with self._order_pool_lock:
+                if len(self._order_pool) < ORDER_POOL_MAX_SIZE:
+                    self._order_pool.append(order)
         if phone_number in self.cached_products:
             del self.cached_products[phone_number]
         
         # Also clear from MongoDB
         try:
             self.conversation_manager.db.product_cache.delete_one({'phone_number': phone_number})
-            logger.info(f"🧹 Cleared data for {phone_number} (Memory + MongoDB)")
+            logger.info("🧹 Cleared data for %s (Memory + MongoDB)", phone_number)
         except Exception as e:
             logger.error(f"Error clearing MongoDB cache: {e}")
-            logger.info(f"🧹 Cleared data for {phone_number} (Memory only)")
+            logger.info("🧹 Cleared data for %s (Memory only)", phone_number)
     
     def handle_order_collection(self, phone_number: str, user_message: str, order_data: dict) -> str:
         """
@@ -586,118 +1075,195 @@ class AgentOrchestrator:
         Returns:
             Response asking for next required detail
         """
-        try:
-            # Get or create order data for this user
-            user_order = self.get_order_data(phone_number)
-            
-            # Save product details from order_data (from classifier or user message)
-            if order_data.get('product_name') and not user_order.product_name:
-                user_order.product_name = order_data['product_name']
-                logger.info(f"📦 Product name saved: {user_order.product_name}")
-            
-            if order_data.get('product_url') and not user_order.product_url:
-                user_order.product_url = order_data['product_url']
-                logger.info(f"🔗 Product URL saved: {user_order.product_url}")
+        # Get or create order data for this user
+        user_order = self.get_order_data(phone_number)
+        user_state = self.get_user_state(phone_number)
+        
+        # Save product details from order_data (from classifier or user message)
+        if order_data.get('product_name') and not user_order.product_name:
+            user_order.product_name = order_data['product_name']
+            logger.info("📦 Product name saved: %s", user_order.product_name)
+        
+        if order_data.get('product_url') and not user_order.product_url:
+            user_order.product_url = order_data['product_url']
+            logger.info("🔗 Product URL saved: %s", user_order.product_url)
+        
+        # Extract product details from user_message if not already saved
+        if not user_order.product_name or not user_order.product_url:
+            # Check if message contains URL
+            url_match = _URL_RE.search(user_message)
             
-            # Extract product details from user_message if not already saved
-            if not user_order.product_name or not user_order.product_url:
-                import re
-                # Check if message contains URL
-                url_pattern = r'(https?://[^\s]+)'
-                url_match = re.search(url_pattern, user_message)
+            if url_match:
+                extracted_url = url_match.group(1)
+                if not user_order.product_url:
+                    user_order.product_url = extracted_url
+                    logger.info("🔗 Extracted URL from message: %s", extracted_url)
                 
-                if url_match:
-                    extracted_url = url_match.group(1)
-                    if not user_order.product_url:
-                        user_order.product_url = extracted_url
-                        logger.info(f"🔗 Extracted URL from message: {extracted_url}")
+                # Extract product name (text before URL)
+                if not user_order.product_name:
+                    text_before_url = user_message[:url_match.start()].strip()
+                    # Remove common prefixes
+                    text_before_url = _strip_prefix(text_before_url, _ORDER_MESSAGE_PREFIXES)
                     
-                    # Extract product name (text before URL)
-                    if not user_order.product_name:
-                        text_before_url = user_message[:url_match.start()].strip()
-                        # Remove common prefixes
-                        prefixes = ['i want to buy', 'i want', 'buy', 'order', 'mane joiye', 'joiye']
-                        for prefix in prefixes:
-                            if text_before_url.lower().startswith(prefix):
-                                text_before_url = text_before_url[len(prefix):].strip()
-                                break
-                        
-                        if text_before_url and len(text_before_url) > 3:
-                            user_order.product_name = text_before_url
-                            logger.info(f"📦 Extracted product name from message: {text_before_url}")
-            
-            # Set phone number from WhatsApp
-            if not user_order.phone_number:
-                user_order.phone_number = phone_number
-            
-            # Process user's current message to extract details if in COLLECTING_DETAILS state
-            if user_state and user_state.name == 'COLLECTING_DETAILS':
-                # User is providing details, try to extract them
-                if not user_order.customer_name:
-                    # This message should be the name
-                    name = user_message.strip()
-                    # Validate: name should be reasonable
-                    if len(name) > 2 and not name.startswith('http'):
-                        user_order.customer_name = name
-                        logger.info(f"👤 Customer name saved: {name}")
-                
-                elif not user_order.address:
-                    # This message should be the address
-                    address = user_message.strip()
-                    # Validate: address should be reasonably long
-                    if len(address) > 10:
-                        user_order.address = address
-                        logger.info(f"📍 Address saved: {address[:50]}...")
-            
-            # Check what information is still needed
+                    if text_before_url and len(text_before_url) > 3:
+                        user_order.product_name = text_before_url
+                        logger.info("📦 Extracted product name from message: %s", text_before_url)
+        
+        # Set phone number from WhatsApp
+        if not user_order.phone_number:
+            user_order.phone_number = phone_number
+        
+        # Process user's current message to extract details if in COLLECTING_DETAILS state
+        if user_state and user_state.name == 'COLLECTING_DETAILS':
+            # User is providing details, try to extract them
             if not user_order.customer_name:
-                # Ask for name
-                self.set_user_state(phone_number, ConversationState.COLLECTING_DETAILS)
-                
-                # Include product info in first message if available
-                if user_order.product_name:
-                    return f"""✅ સરસ! તમે ઓર્ડર કરવા માંગો છો / Great! You want to order:
-
-📦 {user_order.product_name}
-{f'🔗 {user_order.product_url}' if user_order.product_url else ''}
-
-મહેરબાની કરીને તમારું નામ આપો.
-Please provide your name."""
-                else:
-                    return "મહેરબાની કરીને તમારું નામ આપો.\n\nPlease provide your name."
+                # This message should be the name
+                name = user_message.strip()
+                # Validate: name should be reasonable
+                if len(name) > 2 and not name.startswith('http'):
+                    user_order.customer_name = name
+                    logger.info("👤 Customer name saved: %s", name)
             
             elif not user_order.address:
-                # Ask for address
-                return "તમારું સરનામું શું છે?\n\nPlease provide your delivery address."
-            
-            elif user_order.is_complete():
-                # All details collected, show summary and ask for confirmation
-                self.set_user_state(phone_number, ConversationState.AWAITING_FINAL_CONFIRMATION)
-                
-                summary = f"""✅ તમારા ઓર્ડરની વિગતો / Your Order Details:
-
-📦 Product: {user_order.product_name or 'N/A'}
-{f'🔗 URL: {user_order.product_url}' if user_order.product_url else ''}
-👤 Name: {user_order.customer_name}
-📱 Phone: {user_order.phone_number}
-📍 Address: {user_order.address}
-
-શું તમે આ ઓર્ડર કન્ફર્મ કરવા માંગો છો?
-Do you want to confirm this order?
-
-Type "yes" to confirm or provide corrections."""
-                
-                return summary
-            
+                # This message should be the address
+                address = user_message.strip()
+                # Validate: address should be reasonably long
+                if len(address) > 10:
+                    user_order.address = address
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info("📍 Address saved: %s...", address[:50])
+        
+        # Ask for whatever information is still needed
+        return self._order_collectors[user_order.missing_fields()](phone_number, user_order)
+    
+    def _ask_customer_name(self, phone_number: str, user_order: OrderData) -> str:
+        """Ask for name (includes product info in first message if available)"""
+        self.set_user_state(phone_number, ConversationState.COLLECTING_DETAILS)
+        return user_order.ask_name_message()
+    
+    def _ask_address(self, phone_number: str, user_order: OrderData) -> str:
+        """Ask for delivery address"""
+        return ASK_ADDRESS_MSG
+    
+    def _ask_order_confirmation(self, phone_number: str, user_order: OrderData) -> str:
+        """All details collected, show summary and ask for confirmation"""
+        self.set_user_state(phone_number, ConversationState.AWAITING_FINAL_CONFIRMATION)
+        return user_order.summary_message()
+    
+    def _ask_missing_details(self, phone_number: str, user_order: OrderData) -> str:
+        """Name and address present but phone/product missing: ask for details"""
+        return "કૃપા કરીને તમારી વિગતો આપો.\n\nPlease provide your details."
+    
+    def _get_chat_prompt_cache(self, model_name: str) -> Optional[str]:
+        """
+        Name of the shared system-prompt context cache, or None when caching is
+        unavailable (caller then sends the full prompt). Only reads the stored entry:
+        a due create/refresh is started in a worker thread, so the chat loop never waits on it
+        """
+        entry = self._chat_prompt_caches.get(model_name)
+        if entry is None or time.monotonic() - entry[1] >= CHAT_PROMPT_CACHE_REFRESH:
+            task = self._chat_cache_tasks.get(model_name)
+            if task is None or task.done():
+                self._chat_cache_tasks[model_name] = asyncio.create_task(
+                    asyncio.to_thread(self._refresh_chat_prompt_cache, model_name)
+                )
+        return entry[0].name if entry and entry[0] else None
+    
+    def _refresh_chat_prompt_cache(self, model_name: str):
+        """Extend the chat prompt cache's TTL, or create it (blocking SDK calls, run off the chat loop)"""
+        entry = self._chat_prompt_caches.get(model_name)
+        now = time.monotonic()
+        cache = entry[0] if entry else None
+        try:
+            if cache is not None:
+                cache.update(ttl=CHAT_PROMPT_CACHE_TTL)
             else:
-                # Shouldn't reach here, but ask for missing info
-                return "કૃપા કરીને તમારી વિગતો આપો.\n\nPlease provide your details."
-                
+                cache = caching.CachedContent.create(
+                    model=model_name,
+                    display_name=CHAT_PROMPT_CACHE_NAME,
+                    system_instruction=_CHAT_SYSTEM_PROMPT,
+                    ttl=CHAT_PROMPT_CACHE_TTL
+                )
+                logger.info("✅ Chat prompt cache created: %s", cache.name)
         except Exception as e:
-            logger.error(f"Error in order collection: {e}")
-            return "માફ કરશો, ઓર્ડર પ્રોસેસ કરવામાં સમસ્યા છે.\n\nSorry, there was an issue processing your order."
+            logger.warning(f"⚠️ Chat prompt cache unavailable, sending full prompt: {e}")
+            cache = None
+        
+        self._chat_prompt_caches[model_name] = (cache, now)
     
-    def handle_general_chat(self, phone_number: str, user_message: str, conversation_history: list) -> str:
+    def _build_chat_request(self, phone_number: str, user_message: str,
+                            conversation_history: list) -> Tuple[Optional[str], str, str]:
+        """
+        Build the chat prompt as (context cache name, prefix, body); prefix is the system
+        prompt when it isn't served from the context cache, otherwise empty
+        """
+        model_name = self._chat_model_name
+        
+        # Build conversation context (system prompt comes from the context cache when available)
+        # Add conversation history (last 10 messages for better context), rendered from the
+        # history just read from MongoDB so it is never stale
+        history = "".join(
+            render_history_line(msg.get('role', 'user'), msg.get('content', ''))
+            for msg in conversation_history[-CHAT_HISTORY_TURNS:]
+        )
+        context = (
+            f"CONVERSATION HISTORY:\n{history}"
+            f"\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
+            f"CURRENT USER MESSAGE: {user_message}\n\n"
+            "YOUR RESPONSE (Follow system prompt rules strictly!):"
+        )
+        
+        # Cache lookup is a dict hit; the periodic refresh runs in a worker thread
+        cache_name = self._get_chat_prompt_cache(model_name)
+        if cache_name is None:
+            return None, _CHAT_PROMPT_PREFIX, context
+        return cache_name, "", context
+    
+    async def _gemini_generate(self, prompt: str, cache_name: Optional[str], generation_config: dict) -> str:
+        """One generateContent call over the shared HTTP session; returns the reply text"""
+        if self._chat_http is None:
+            self._chat_http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=CHAT_HTTP_MAX_CONNECTIONS),
+                headers={"x-goog-api-key": settings.google_api_key},
+                timeout=aiohttp.ClientTimeout(total=CHAT_RESPONSE_TIMEOUT)
+            )
+        
+        payload = {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": generation_config
+        }
+        if cache_name:
+            payload["cachedContent"] = cache_name
+        
+        async with self._chat_http.post(self._chat_generate_url, json=payload) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"Gemini HTTP {resp.status}: {(await resp.text())[:200]}")
+            data = await resp.json()
+        
+        candidates = data.get("candidates") or []
+        parts = candidates[0].get("content", {}).get("parts", []) if candidates else []
+        if not parts:
+            raise ValueError(f"Gemini returned no text (feedback: {data.get('promptFeedback')})")
+        text = parts[0].get("text", "") if len(parts) == 1 else "".join(part.get("text", "") for part in parts)
+        return _strip_if_padded(text)
+    
+    def _embed_chat_message(self, message: str) -> Optional[np.ndarray]:
+        """Unit-length embedding of a normalized chat message (None if the embedding call fails)"""
+        try:
+            result = genai.embed_content(
+                model=CHAT_EMBEDDING_MODEL,
+                content=message,
+                task_type="semantic_similarity",
+                output_dimensionality=768
+            )
+            vector = np.asarray(result['embedding'], dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            return vector / norm if norm else None
+        except Exception as e:
+            logger.warning(f"⚠️ Chat cache embedding failed: {e}")
+            return None
+    
+    async def handle_general_chat_async(self, phone_number: str, user_message: str, conversation_history: list) -> str:
         """
         Handle general chat using Gemini AI with proper system prompt
         
@@ -709,52 +1275,63 @@ Type "yes" to confirm or provide corrections."""
         Returns:
             AI generated response
         """
+        # Bare greetings short-circuit to the stock welcome
+        if len(user_message) <= STOCK_REPLY_MAX_CHARS:
+            stock_reply = _stock_reply(user_message.strip().lower())
+            if stock_reply is not None:
+                return stock_reply
+        
+        # Repeated chit-chat is answered from this user's reply cache without calling Gemini;
+        # the embedding call is only made when there is a cached message to compare against
+        cache_key = ChatResponseCache.make_key(phone_number, user_message, conversation_history)
+        vector = None
+        if cache_key is not None:
+            context, message = cache_key
+            cached_reply = self._chat_responses.get_exact(cache_key)
+            if cached_reply is None and self._chat_responses.has_candidates(context):
+                vector = await asyncio.to_thread(self._embed_chat_message, message)
+                if vector is not None:
+                    cached_reply = self._chat_responses.get_similar(context, vector)
+            if cached_reply is not None:
+                logger.info("💾 Chat reply served from cache for %s", phone_number)
+                return cached_reply
+        
+        cache_name, prefix, body = self._build_chat_request(phone_number, user_message, conversation_history)
+        
+        # Generate response (one prompt per conversation; users' histories are never mixed)
         try:
-            import google.generativeai as genai
-            import os
-            from system_prompt_config import get_system_prompt
-            
-            # Get API key
-            api_key = os.getenv("Google_api")
-            if not api_key:
-                return "I'm having trouble connecting right now. Please try again later! 😊"
-            
-            # Configure Gemini
-            genai.configure(api_key=api_key)
-            model_name = os.getenv("google_model", "gemini-2.0-flash-exp")
-            model = genai.GenerativeModel(model_name)
-            
-            # Get complete system prompt from config
-            system_prompt = get_system_prompt()
-            
-            # Build conversation context
-            context = system_prompt + "\n\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-            context += "CONVERSATION HISTORY:\n"
-            
-            # Add conversation history (last 10 messages for better context)
-            for msg in conversation_history[-10:]:
-                role = msg.get('role', 'user')
-                content = msg.get('content', '')
-                if role == 'user':
-                    context += f"USER: {content}\n"
-                else:
-                    context += f"ASSISTANT: {content}\n"
-            
-            context += f"\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-            context += f"CURRENT USER MESSAGE: {user_message}\n\n"
-            context += "YOUR RESPONSE (Follow system prompt rules strictly!):"
-            
-            # Generate response
-            response = model.generate_content(
-                context,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.7,
-                    max_output_tokens=2000
-                )
-            )
-            
-            return response.text.strip()
-            
-        except Exception as e:
-            logger.error(f"Error in general chat: {e}")
-            return "Hello! How can I help you today? 😊\n\nI can help you:\n🔍 Find watches\n📦 Browse products\n💬 Answer questions"
+            reply = await self._gemini_generate(prefix + body, cache_name, _CHAT_GENERATION_CONFIG)
+        except Exception:
+            logger.error("❌ Gemini chat call failed for %s", phone_number, exc_info=True)
+            return _CHAT_FALLBACK_REPLY
+        
+        if cache_key is not None and reply:
+            self._chat_responses.put(cache_key, vector, reply)
+            if vector is None:
+                # Embed after replying so later lookups can match by similarity
+                task = asyncio.create_task(self._embed_cached_reply(cache_key, reply))
+                self._chat_embed_tasks.add(task)
+                task.add_done_callback(self._chat_embed_tasks.discard)
+        return reply
+    
+    async def _embed_cached_reply(self, cache_key: tuple, reply: str):
+        """Attach the message embedding to a reply cached without one"""
+        vector = await asyncio.to_thread(self._embed_chat_message, cache_key[1])
+        if vector is not None:
+            self._chat_responses.put(cache_key, vector, reply)
+    
+    def handle_general_chat(self, phone_number: str, user_message: str, conversation_history: list) -> str:
+        """
+        Sync entry point for the Flask webhook: runs handle_general_chat_async on the shared
+        chat event loop so in-flight Gemini calls don't each hold a thread of their own
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.handle_general_chat_async(phone_number, user_message, conversation_history),
+            _get_chat_loop()
+        )
+        try:
+            return future.result(timeout=CHAT_RESPONSE_TIMEOUT)
+        except FutureTimeoutError:
+            future.cancel()
+            logger.error(f"⏱️ General chat timed out after {CHAT_RESPONSE_TIMEOUT}s for {phone_number}")
+            return _CHAT_FALLBACK_REPLY
@@ -6,68 +6,76 @@ Uses Google Gemini API with Context Caching
 """
 
 import os
+import hashlib
 import json
 import logging
+import re
+import threading
+import sys
 import time
-from datetime import datetime, timedelta
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import timedelta
+from enum import StrEnum
+import numpy as np
 import google.generativeai as genai
 from google.generativeai import caching
 
-logger = logging.getLogger(__name__)
-
-class BackendToolClassifier:
-    """
-    Backend AI that classifies user intent and decides which tool to call
-    This AI does NOT respond to user - it only decides actions
-    Uses Google Gemini API
-    """
-    
-    def __init__(self):
-        """
-        Initialize Backend Tool Classifier with Gemini
-        """
-        self.api_key = os.getenv("Google_api")
-        if not self.api_key:
-            logger.warning("⚠️ Google_api not found in environment variables. Please set it.")
-            
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
-            
-        # Get model from env or use default
-        env_model = os.getenv("google_model", "gemini-2.5-flash")
-        # Ensure model name has 'models/' prefix if not present (Gemini API often prefers it)
-        if not env_model.startswith("models/") and not env_model.startswith("gemini-"):
-             self.model_name = f"models/{env_model}"
-        else:
-             self.model_name = env_model
-             
-        self.cache_name = "watchvine_classifier_cache_v10_photo_fix"  # Fixed: Don't greet when asking for photos
-        self.cached_content = None
-        self.last_cache_update = 0
-        self.CACHE_TTL = 1800 # 30 minutes refresh
+from settings import settings
 
-        # Rate limit tracking
-        self.last_request_time = {}
-        self.min_request_interval = 1.0 
-        
-        logger.info(f"✅ Backend Classifier initialized with Gemini ({self.model_name})")
-
-    def _get_static_instructions(self) -> str:
-        """Returns the static part of the system prompt to be cached"""
-        return """
-WatchVine Backend Tool Classifier AI System - Gemini 2.5 Flash Optimized
-========================================================================
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # Fall back to the stdlib parser when orjson isn't installed
+    _json_loads = json.loads
 
-🎯 CORE MISSION: Route user requests to correct tool with smart keyword/brand extraction
+logger = logging.getLogger(__name__)
 
-CRITICAL KEYWORD EXTRACTION RULES (MUST FOLLOW):
-- Extract ONLY brand names for watches (Rolex, Fossil, Armani, etc.)
-- Extract ONLY keywords for other products (black, leather, formal, red, designer, etc.)
-- NEVER search full sentences or messages
-- NEVER include generic words like "watch", "bag", "shoes" as keywords
-- NEVER extract style/category words when product type is unclear
+# Routing rules sent with every classifier request (the context cache's system instruction)
+_RULES_CORE = """
+WatchVine Backend Tool Classifier
+=================================
+
+You route WhatsApp shopping messages to exactly one tool. You NEVER write customer-facing replies;
+the conversation agent does that. Decide from the CURRENT MESSAGE, using CONVERSATION HISTORY and
+SEARCH INFO for context. The reference material has brand lists, field details and worked examples.
+
+TOOLS (check in this order):
+1. find_product_by_range - TWO prices plus a category ("2000 thi 2500 watches", "between 3000 and 8000 bags").
+   Fill category, min_price, max_price and product_name as "₹{min}-₹{max} {category}".
+   One price or a brand with a range is find_product.
+2. greeting - a pure greeting ("hello", "hi", "namaste", "good morning") with no product words.
+3. save_data_to_google_sheet - ONLY when the user confirms ("yes") right after an order summary AND the
+   history holds every order field (to, name, phone, address, area, near, city, state, pincode, quantity,
+   product_name, product_url); put them in data. Anything missing or fake -> ai_chat.
+4. show_more - explicit "show more", "more", "next", "aur dikhao", "biji dikhao", "aage dikhao" AND SEARCH INFO
+   shows pending products. Without pending products -> ai_chat. "1", "2", "yes", "okay" are never show_more.
+5. find_product - a brand, gender, budget, belt type or color for a product.
+6. show_all_brands - "show all", "sab brands", "sabhi dikhao" within a category known from context; fill category_key.
+7. send_all_images - all photos of one named product; fill product_name.
+8. ask_category_selection - a product type with no brand and no gender ("show me watches", "I want bags");
+   fill product_type.
+9. ai_chat - everything else: questions, order intent, menu numbers, yes/okay, style-only requests
+   (professional, formal, wedding... without a brand), wholesale, warranty and authenticity questions.
+
+find_product FIELDS:
+- keyword: ONLY the brand name found in the message ("muje rolex watch chahiye" -> "rolex"). For non-watch
+  products without a brand, the one descriptive word ("black leather bag" -> "black"). Never the sentence,
+  never generic words like "watch" or "bag".
+- category_key: mens_watch, womens_watch, mens_sunglasses, womens_sunglasses, mens_shoes, womens_shoes,
+  handbag, wallet, bracelet. A watch without a gender is mens_watch.
+- min_price / max_price: "under 3000" / "3000 ni ander" -> max_price 3000; "5000 thi upar" / "above 5000" -> min_price 5000.
+- belt_type: rubber_belt, leather_belt, metal_belt or plastic_belt.
+- colors: capitalized color names, e.g. ["Black", "Gold"].
+- is_automatic: true for automatic / mechanical / self-winding, false for quartz.
+- watch_type: sports, dress, diving, aviation, racing, professional, casual, luxury, fashion, vintage, modern, smartwatch.
+Leave every field that isn't mentioned null.
+"""
 
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# Reference material (brand lists, field details, worked examples); lives only in the context cache
+_EXAMPLES_CORPUS = """
+WatchVine Classifier Reference
+==============================
 
 PRODUCT HANDLING LOGIC:
 
@@ -126,33 +134,6 @@ Input: "gold bracelet" → Extract: "gold" (bracelet, keyword search)
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
-GEMINI 2.5 FLASH OPTIMIZATION:
-- Use structured JSON responses consistently
-- Be concise and direct (Gemini 2.5 is faster at clear logic)
-- Extract intent clearly: watch (brand-required) vs other (keyword-search)
-- Detect category automatically from context
-- Return tool decision with high confidence
-
-Return format: {"tool": "...", "keyword": "...", "category_key": "...", "min_price": null, "max_price": null}
-
-ROLE & PURPOSE:
-You are a tool detection AI. You analyze messages and decide which tool to call.
-Your job is decision-making, NOT customer interaction.
-
-CRITICAL RULES:
-- You NEVER generate customer-facing chat responses
-- You ONLY output structured JSON
-- For find_product: Extract ONLY brand name as keyword (rolex, fossil, casio - NOT full sentence)
-- Analyze conversation context for intelligent routing
-SYSTEM ARCHITECTURE:
-This is a multi-agent system where:
-1. You (Backend Classifier) → Decides which tool to call
-2. Conversation Agent → Handles actual customer chat responses  
-3. Product Search API → Retrieves product information
-4. Google Sheets API → Saves order data
-
-Your decisions directly impact customer satisfaction - choose wisely!
-
 AVAILABLE TOOLS & DECISION LOGIC:
 ========================================
 
@@ -180,8 +161,6 @@ TOOLS & OUTPUT RULES:
    - General conversation, questions about delivery/returns
    - User asks general questions ("shop open?", "delivery time?")
    - User asks for categories without specific brand ("show watches", "bags dikhao")
-   - User asks general questions ("shop open?", "delivery time?")
-   - User asks for categories without specific brand ("show watches", "bags dikhao")
    - User is just chatting
    - User selects numeric options: "1", "2", "3" (e.g. for delivery/pickup options) - CRITICAL
    - User says "yes", "okay", "ha", "haan" (unless explicit "show more" is added) - CRITICAL
@@ -192,7 +171,6 @@ TOOLS & OUTPUT RULES:
    JSON: {"tool": "show_more"}
    Use when:
    - User wants to see more products from CURRENT search
-   - User wants to see more products from CURRENT search
    - User explicit says: "show more", "more", "next", "aur dikhao", "biji dikhao", "aage dikhao"
    - ONLY if SEARCH INFO shows pending products (sent_count < total_found)
    - ⛔ NEVER use for: "1", "2", "yes", "okay", "ha" -> These are options/confirmations -> use ai_chat
@@ -208,19 +186,7 @@ TOOLS & OUTPUT RULES:
    - User specifies belt/strap type ("rubber belt", "leather strap", "metal chain", "plastic belt")
    - User specifies colors ("black watch", "silver watch", "gold color")
 
-4. REMOVED - Category selection now handled by AI chat directly
-   
-   KEYWORD EXTRACTION RULES (CRITICAL - FOLLOW EXACTLY):
-   
-   🚨 YOUR ONLY JOB: Find brand name in user's message and return ONLY that brand name
-   🚨 IGNORE all other words like: muje, chahiye, dikhao, show me, ke, ni, etc.
-   🚨 RETURN ONLY BRAND NAME - Nothing else!
-   
-   STEP-BY-STEP PROCESS:
-   1. Read user's full message
-   2. Find if any brand name exists (Rolex, Fossil, Casio, Tommy, etc.)
-   3. Return ONLY that brand name
-   4. If NO brand found, return empty keyword ""
+   KEYWORD EXTRACTION:
    
    Examples of CORRECT extraction:
    - "mane aa bata vo ne Audemars Piguet" → keyword: "audemars piguet" ✅
@@ -239,19 +205,6 @@ TOOLS & OUTPUT RULES:
    BRAND NAMES TO RECOGNIZE (Search for these in user message):
    Fossil, Tissot, Armani, Armani Exchange, AX, Tommy Hilfiger, Tommy, Rolex, Rado, Omega, Tag Heuer, Tag, Patek Philippe, Patek, Hublot, Cartier, Audemars Piguet, AP, Michael Kors, MK, Alix, Naviforce, Reward, Casio, Gucci, Coach, YSL, Louis Vuitton, LV, Prada, Burberry, Kate Spade, Ray-Ban, Rayban, Oakley, Versace, Tom Ford, Carrera, Police, Diesel, Hugo Boss, Guess, Seiko, Citizen, Longines
    
-   EXTRACTION PROCESS:
-   1. Check if user message contains ANY of above brand names
-   2. If YES → Extract ONLY that brand name (ignore all other words)
-   3. If NO → Return empty keyword ""
-   
-   CRITICAL: Return ONLY brand name, NOT full sentence!
-   
-   EXAMPLES OF EXTRACTION:
-   User says: "mane aa bata vo ne Audemars Piguet" -> keyword: "audemars piguet" (NOT full sentence)
-   User says: "muje rolex watch chahiye" -> keyword: "rolex" (NOT "muje rolex watch chahiye")
-   User says: "show me fossil watch" -> keyword: "fossil" (NOT "show me fossil watch")
-   User says: "casio batao" -> keyword: "casio" (NOT "casio batao")
-   
    GENDER & CATEGORY_KEY DETECTION (CRITICAL FOR ACCURACY):
    Extract gender from user message and map to correct MongoDB category_key:
    - "ladies watch" / "women watch" / "mom mate watch" -> {"keyword": "", "category_key": "womens_watch"}
@@ -717,13 +670,6 @@ Be smart about detecting price ranges from natural language:
 - "10000 ke under" → max: 10000
 - "15000+ watches" → min: 15000
 
-KEYWORD OPTIMIZATION:
-Always include product category with brand for accurate search:
-- "Rolex" → "rolex watch" (not just "rolex")
-- "Gucci" → "gucci bag" (context-dependent: could be bag, wallet, sunglasses)
-- "Ray-Ban" → "ray-ban sunglasses"
-- "Nike" → "nike shoes"
-
 If category unclear from context:
 -First call ai_chat who responce which catagory user want but if he denied to give actchual product name than give most comman and professional watch name.
 ERROR PREVENTION:
@@ -738,197 +684,970 @@ Your decisions must be:
 - ACCURATE: 99%+ correct tool selection
 - CONTEXTUAL: Consider full conversation flow
 - CONSISTENT: Same input patterns → same outputs
+"""
 
-OUTPUT FORMAT:
-Always return VALID JSON only. No explanations, no markdown, no extra text.
-Just pure JSON: {"tool": "tool_name", "additional_params": "values"}
+class Tool(StrEnum):
+    """Classifier tools (str-valued, so they compare and hash like the plain names)"""
+    GREETING = "greeting"
+    AI_CHAT = "ai_chat"
+    SHOW_MORE = "show_more"
+    FIND_PRODUCT = "find_product"
+    FIND_PRODUCT_BY_RANGE = "find_product_by_range"
+    SHOW_ALL_BRANDS = "show_all_brands"
+    SEND_ALL_IMAGES = "send_all_images"
+    ASK_CATEGORY_SELECTION = "ask_category_selection"
+    SAVE_DATA_TO_GOOGLE_SHEET = "save_data_to_google_sheet"
+
+
+class CategoryKey(StrEnum):
+    MENS_WATCH = "mens_watch"
+    WOMENS_WATCH = "womens_watch"
+    MENS_SUNGLASSES = "mens_sunglasses"
+    WOMENS_SUNGLASSES = "womens_sunglasses"
+    MENS_SHOES = "mens_shoes"
+    WOMENS_SHOES = "womens_shoes"
+    LOAFERS = "loafers"
+    HANDBAG = "handbag"
+    WALLET = "wallet"
+    BRACELET = "bracelet"
+
+
+class BeltType(StrEnum):
+    RUBBER = "rubber_belt"
+    LEATHER = "leather_belt"
+    METAL = "metal_belt"
+    PLASTIC = "plastic_belt"
+
+
+class WatchType(StrEnum):
+    SPORTS = "sports"
+    DRESS = "dress"
+    DIVING = "diving"
+    AVIATION = "aviation"
+    RACING = "racing"
+    PROFESSIONAL = "professional"
+    CASUAL = "casual"
+    LUXURY = "luxury"
+    FASHION = "fashion"
+    VINTAGE = "vintage"
+    MODERN = "modern"
+    SMARTWATCH = "smartwatch"
+
+
+# Decision fields that only take values from a fixed set; parsed values are swapped for the members
+_ENUM_FIELDS = {'tool': Tool, 'category_key': CategoryKey, 'belt_type': BeltType, 'watch_type': WatchType}
+
+
+def _enum_schema(values, nullable: bool = True) -> dict:
+    return {"type": "string", "format": "enum", "enum": [v.value for v in values], "nullable": nullable}
+
+
+# Shape of every classifier decision; Gemini decodes against this schema, so replies are always
+# one well-formed JSON object (fields that don't apply come back null)
+_NULLABLE_STRING = {"type": "string", "nullable": True}
+_NULLABLE_INTEGER = {"type": "integer", "nullable": True}
+_DECISION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tool": _enum_schema(Tool, nullable=False),
+        "keyword": _NULLABLE_STRING,
+        "category_key": _enum_schema(CategoryKey),
+        "min_price": _NULLABLE_INTEGER,
+        "max_price": _NULLABLE_INTEGER,
+        "belt_type": _enum_schema(BeltType),
+        "colors": {"type": "array", "items": {"type": "string"}, "nullable": True},
+        "is_automatic": {"type": "boolean", "nullable": True},
+        "watch_type": _enum_schema(WatchType),
+        "category": _NULLABLE_STRING,
+        "product_name": _NULLABLE_STRING,
+        "product_type": _NULLABLE_STRING,
+        "response": _NULLABLE_STRING,
+        "data": {
+            "type": "object",
+            "nullable": True,
+            "properties": {
+                "to": _NULLABLE_STRING, "name": _NULLABLE_STRING, "phone": _NULLABLE_STRING,
+                "address": _NULLABLE_STRING, "area": _NULLABLE_STRING, "near": _NULLABLE_STRING,
+                "city": _NULLABLE_STRING, "state": _NULLABLE_STRING, "pincode": _NULLABLE_STRING,
+                "quantity": _NULLABLE_INTEGER, "product_name": _NULLABLE_STRING, "product_url": _NULLABLE_STRING
+            }
+        }
+    },
+    "required": ["tool"]
+}
+# Room for the largest decision (save_data_to_google_sheet with a full order)
+DECISION_MAX_OUTPUT_TOKENS = 256
+# Bundled into every classifier model: greedy decoding so identical prompts give identical decisions
+_DECISION_GENERATION_CONFIG = {
+    "temperature": 0.0,
+    "top_p": 1.0,
+    "top_k": 1,
+    "candidate_count": 1,
+    "max_output_tokens": DECISION_MAX_OUTPUT_TOKENS,
+    "response_mime_type": "application/json",
+    "response_schema": _DECISION_SCHEMA,
+}
+# The classifier only emits routing JSON, never user-facing text, so nothing needs blocking
+_CLASSIFIER_SAFETY_SETTINGS = {
+    "harassment": "block_none",
+    "hate_speech": "block_none",
+    "sexually_explicit": "block_none",
+    "dangerous_content": "block_none",
+}
+
+# Rough size (~4 chars per token) and content fingerprint of the cached prompt; the fingerprint
+# names the Gemini cache so editing the rules or the reference automatically yields a new cache
+_PROMPT_TOKEN_ESTIMATE = (len(_RULES_CORE) + len(_EXAMPLES_CORPUS)) // 4
+# Gemini's minimum cacheable prompt size (1024 tokens for 2.5 Flash, 2048 for 2.5 Pro)
+MIN_CACHE_TOKENS = 2048
+# Exact cached-prompt size per model, counted once per process (model name -> tokens)
+_PROMPT_TOKENS = {}
+# Server-side lifetime of the context cache; extended whenever the local refresh runs
+CACHE_SERVER_TTL = timedelta(hours=2)
+# Local refresh cadence for the cache (seconds, measured on the monotonic clock)
+CACHE_REFRESH_INTERVAL = 1800
+# Per-user request spacing; the tracking map is an LRU capped at RATE_LIMIT_MAX_USERS phones
+MIN_REQUEST_INTERVAL_NS = 1_000_000_000
+RATE_LIMIT_MAX_USERS = 10_000
+# Live cache shared with sibling worker processes and restarts: {"name": ..., "refreshed": epoch seconds}
+CACHE_NAME_FILE = "/tmp/watchvine_cache.json"
+# Cache warm-up and refreshes run on this pool; a request waits at most CACHE_WARMUP_WAIT
+# seconds for an unfinished warm-up before going uncached
+CACHE_WARMUP_WAIT = 2.0
+# Upper bound on one Gemini classification call (seconds)
+CLASSIFY_TIMEOUT = 5
+# Calls on the cached model are checked in windows of CACHE_HIT_WINDOW: below CACHE_MIN_HIT_RATE
+# the cache is recreated once, and dropped (back to standard requests) for CACHE_DISABLE_PERIOD
+# seconds if the next window misses too
+CACHE_HIT_WINDOW = 200
+CACHE_MIN_HIT_RATE = 0.2
+CACHE_DISABLE_PERIOD = 3600
+_CACHE_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="classifier-cache")
+
+# GenerativeModel objects shared by every classifier instance in the process:
+# (model name, cache resource name or None) -> model
+_SHARED_MODELS = {}
+_SHARED_MODELS_LOCK = threading.Lock()
+
+
+def _get_shared_model(model_name: str, cached_content=None):
+    """
+    Model bound to cached_content, or the full-prompt model (rules and reference in the system
+    instruction) when cached_content is None.
+    Built once per key, so instances don't each set up their own client state.
+    """
+    key = (model_name, cached_content.name if cached_content is not None else None)
+    with _SHARED_MODELS_LOCK:
+        model = _SHARED_MODELS.get(key)
+        if model is None:
+            if cached_content is not None:
+                model = genai.GenerativeModel.from_cached_content(
+                    cached_content=cached_content,
+                    generation_config=_DECISION_GENERATION_CONFIG,
+                    safety_settings=_CLASSIFIER_SAFETY_SETTINGS
+                )
+            else:
+                model = genai.GenerativeModel(
+                    model_name,
+                    system_instruction=_RULES_CORE + _EXAMPLES_CORPUS,
+                    generation_config=_DECISION_GENERATION_CONFIG,
+                    safety_settings=_CLASSIFIER_SAFETY_SETTINGS
+                )
+            _SHARED_MODELS[key] = model
+        return model
+_PROMPT_HASH = hashlib.blake2b(f"{_RULES_CORE}\0{_EXAMPLES_CORPUS}".encode("utf-8"), digest_size=8).hexdigest()
+
+# Vocabulary for the local fast path: plain "<brand> [gender] [product]" searches are classified
+# by dictionary lookup instead of a Gemini round-trip. Any word outside this vocabulary (prices,
+# styles, colors, order words, ...) sends the message to Gemini as before.
+_BRANDS = (
+    'armani exchange', 'tommy hilfiger', 'tag heuer', 'patek philippe', 'audemars piguet',
+    'michael kors', 'louis vuitton', 'kate spade', 'tom ford', 'hugo boss', 'jaeger-lecoultre',
+    'fossil', 'tissot', 'armani', 'ax', 'tommy', 'rolex', 'rado', 'omega', 'tag',
+    'patek', 'hublot', 'cartier', 'ap', 'mk', 'alix', 'naviforce', 'reward', 'casio',
+    'gucci', 'coach', 'ysl', 'lv', 'prada', 'burberry', 'ray-ban', 'rayban', 'oakley',
+    'versace', 'carrera', 'police', 'diesel', 'guess', 'seiko', 'citizen', 'longines',
+    'breitling', 'tudor', 'iwc', 'vacheron', 'zenith'
+)
+_BRAND_SET = frozenset(_BRANDS)
+# Brands better known for bags/eyewear; a bare brand name from these is left to Gemini
+_NON_WATCH_BRANDS = frozenset({
+    'louis vuitton', 'lv', 'kate spade', 'coach', 'michael kors', 'mk', 'gucci', 'prada', 'ysl',
+    'burberry', 'ray-ban', 'rayban', 'oakley', 'carrera'
+})
+_GENDER_WORDS = {
+    'men': 'mens', 'mens': 'mens', 'man': 'mens', 'gents': 'mens', 'gent': 'mens', 'boys': 'mens',
+    'boy': 'mens', 'male': 'mens', 'ladies': 'womens', 'lady': 'womens', 'women': 'womens',
+    'womens': 'womens', 'woman': 'womens', 'girls': 'womens', 'girl': 'womens', 'female': 'womens'
+}
+_PRODUCT_WORDS = {
+    'watch': 'watch', 'watches': 'watch', 'ghadi': 'watch',
+    'sunglass': 'sunglasses', 'sunglasses': 'sunglasses', 'glass': 'sunglasses', 'glasses': 'sunglasses',
+    'shoe': 'shoes', 'shoes': 'shoes',
+    'bag': 'bag', 'bags': 'bag', 'handbag': 'bag', 'handbags': 'bag',
+    'wallet': 'wallet', 'wallets': 'wallet',
+    'bracelet': 'bracelet', 'bracelets': 'bracelet'
+}
+_FILLER_WORDS = frozenset({
+    'mane', 'mne', 'muje', 'mujhe', 'chahiye', 'chaiye', 'dikhao', 'dikhado', 'batao', 'batavo',
+    'bata', 'vo', 'joie', 'joiye', 'che', 'ke', 'ka', 'ki', 'ni', 'nu', 'na', 'me', 'ne', 'aa',
+    'show', 'send', 'want', 'need', 'i', 'a', 'an', 'the', 'for', 'some', 'please', 'pls', 'plz',
+    's', 'bhai', 'sir'
+})
+# Keyword cleanup: product words dropped from two-word keywords, and words never taken as a keyword
+_KEYWORD_PRODUCT_TYPES = frozenset({
+    'watch', 'watches', 'bag', 'bags', 'shoe', 'shoes', 'sunglass', 'sunglasses',
+    'wallet', 'wallets', 'bracelet', 'bracelets', 'glass', 'glasses'
+})
+_KEYWORD_FILLER_WORDS = frozenset({
+    'mane', 'muje', 'chahiye', 'dikhao', 'joie', 'che', 'ke', 'ni', 'me', 'ne', 'show', 'vo', 'bata',
+    'aa', 'bai', 'do', 'go', 'for', 'the', 'a', 'an', 'is', 'are', 'be', 'been', 'being', 'have', 'has',
+    'does', 'did'
+})
+# One lookup table keyed by the space-joined word sequence of each term
+_FAST_TERMS = {' '.join(re.findall(r'\w+', brand)): ('brand', brand) for brand in _BRANDS}
+_FAST_TERMS.update({w: ('gender', g) for w, g in _GENDER_WORDS.items()})
+_FAST_TERMS.update({w: ('product', p) for w, p in _PRODUCT_WORDS.items()})
+_FAST_TERMS.update({w: ('filler', w) for w in _FILLER_WORDS})
+_FAST_TERM_MAX_WORDS = max(k.count(' ') + 1 for k in _FAST_TERMS)
+_WORD_RE = re.compile(r'\w+')
+# Style words that, without a brand, make a request style-only (matched anywhere in a word)
+_STYLE_WORDS = frozenset({
+    'professional', 'formal', 'casual', 'wedding', 'minimalistic', 'fancy', 'elegant',
+    'vintage', 'modern', 'classic', 'sporty', 'luxury', 'simple', 'analog', 'digital',
+    'smartwatch', 'automatic', 'mechanical', 'quartz', 'dress', 'business', 'daily',
+    'occasion', 'special', 'unique', 'trendy', 'stylish', 'sleek', 'bold', 'minimal'
+})
+
+
+def _alternation(terms) -> str:
+    return "|".join(map(re.escape, sorted(terms, key=len, reverse=True)))
+
+
+# Brands (whole words) and style words in one compiled alternation, longest first, so a message
+# is scanned once for both; the named group that matched tells which kind of term was hit
+_KEYWORD_RE = re.compile(rf"(?P<brand>\b(?:{_alternation(_BRANDS)})\b)|(?P<style>{_alternation(_STYLE_WORDS)})")
+
+
+def _find_brand(text: str):
+    """First brand mentioned in lowercased text, or None"""
+    for match in _KEYWORD_RE.finditer(text):
+        if match.lastgroup == 'brand':
+            return match.group()
+    return None
+
+# Product links quoted in the conversation (order extraction)
+_URL_RE = re.compile(r'https?://[^\s]+')
+
+# Price ranges ("2000 thi 2500 watches", "between 3000 and 8000 bags") are parsed locally;
+# the category word maps to the find_product_by_range category
+_PRICE_RANGE_RE = re.compile(r"(?i)\b(\d{3,6})\s*(?:-|–|to|thi|se|and)\s*(\d{3,6})\b")
+_RANGE_CATEGORY_RE = re.compile(
+    r"(?i)\b(watch(?:es)?|(?:hand)?bags?|sunglass(?:es)?|shoes?|loafers?|wallets?|bracelets?)\b"
+)
+_RANGE_CATEGORIES = {
+    'watch': 'watches', 'watches': 'watches', 'bag': 'bags', 'bags': 'bags', 'handbag': 'bags', 'handbags': 'bags',
+    'sunglass': 'sunglasses', 'sunglasses': 'sunglasses', 'shoe': 'shoes', 'shoes': 'shoes',
+    'loafer': 'shoes', 'loafers': 'shoes', 'wallet': 'wallets', 'wallets': 'wallets',
+    'bracelet': 'bracelets', 'bracelets': 'bracelets'
+}
+
+# Exact (normalized) messages decided without Gemini. Menu picks and confirmations are always
+# ai_chat; greetings are greeting; show-more phrases are show_more only while products are pending.
+_CONFIRMATION_MESSAGES = frozenset({
+    '1', '2', 'yes', 'okay', 'ha', 'haan', 'ok', 'sure', 'home delivery', 'pickup', 'store pickup'
+})
+_GREETINGS = frozenset({
+    'hello', 'hi', 'hey', 'namaste', 'namaskar', 'good morning', 'good evening', 'hola', 'hii', 'helo'
+})
+_SHOW_MORE = frozenset({'show more', 'more', 'next', 'aur dikhao', 'biji dikhao', 'aage dikhao', 'dikhao'})
+
+# Other short messages get the same decision every time they answer the same bot reply with the
+# same pending-products state, so Gemini's decisions for them are remembered in an LRU of
+# DECISION_CACHE_MAX entries keyed on both
+DECISION_CACHE_MAX = 4096
+DECISION_CACHE_MAX_WORDS = 3
+_CACHEABLE_TOOLS = frozenset({Tool.GREETING, Tool.SHOW_MORE, Tool.AI_CHAT})
+# Product searches for messages up to DECISION_CACHE_MAX_PAYLOAD_WORDS are remembered too (and
+# only reused verbatim), but only when every payload field is one of _MESSAGE_PAYLOAD_FIELDS and
+# its value appears in the message; anything else may have been filled in from the history
+DECISION_CACHE_MAX_PAYLOAD_WORDS = 8
+_PAYLOAD_CACHEABLE_TOOLS = frozenset({Tool.FIND_PRODUCT, Tool.FIND_PRODUCT_BY_RANGE})
+_MESSAGE_PAYLOAD_FIELDS = frozenset({'tool', 'keyword', 'min_price', 'max_price', 'colors'})
+
+# Paraphrase cache behind the exact LRU ("haan bhai" ~ "ha"), enabled with SEMCACHE_ENABLED=1.
+# Embeddings are stored int8-quantized in one preallocated matrix and evicted FIFO.
+SEMCACHE_ENABLED = os.getenv("SEMCACHE_ENABLED") == "1"
+SEMCACHE_MAX_ENTRIES = 2048
+SEMCACHE_SIMILARITY = 0.92
+SEMCACHE_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+class _JsonObjectScanner:
+    """
+    Accumulates streamed text and reports when the first top-level JSON object has closed,
+    so the rest of the generation can be abandoned. Braces inside strings are ignored.
+    """
 
-Return ONLY JSON.
-"""
+    def __init__(self):
+        self._parts = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str) -> bool:
+        """Add a chunk; True once the object is complete (text after it is dropped)"""
+        for i, ch in enumerate(text):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = self._depth > 0
+            elif ch == '{':
+                self._depth += 1
+            elif ch == '}' and self._depth:
+                self._depth -= 1
+                if not self._depth:
+                    self._parts.append(text[:i + 1])
+                    return True
+        self._parts.append(text)
+        return False
 
-    def _get_or_create_cache(self):
-        """Creates or retrieves cached content for system instructions"""
-        if not self.api_key:
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+
+class SemanticDecisionCache:
+    """
+    Nearest-neighbour lookup of classifier decisions by message embedding.
+    Only messages seen in the same conversation state (decision key minus the message) are considered.
+    """
+
+    def __init__(self, max_entries: int = SEMCACHE_MAX_ENTRIES, threshold: float = SEMCACHE_SIMILARITY):
+        # Imported here so the bot doesn't load torch unless the cache is enabled
+        from sentence_transformers import SentenceTransformer
+        self._model = SentenceTransformer(SEMCACHE_EMBEDDING_MODEL)
+        self.dimensions = self._model.get_sentence_embedding_dimension()
+        # Cosine threshold in the int8 (x127) embedding space
+        self.min_score = int(threshold * 127 * 127)
+        self._matrix = np.zeros((max_entries, self.dimensions), dtype=np.int8)
+        self._contexts = np.zeros(max_entries, dtype=np.int64)  # hash() of each entry's state
+        self._decisions = [None] * max_entries
+        self._size = 0
+        self._next = 0  # FIFO write position
+        self._lock = threading.Lock()
+
+    def embed(self, message: str):
+        """int8-quantized unit embedding of a normalized message (None if the embedding call fails)"""
+        try:
+            vector = self._model.encode(message, convert_to_numpy=True, normalize_embeddings=True)
+            return np.rint(vector * 127).astype(np.int8)
+        except Exception as e:
+            logger.warning(f"⚠️ Decision cache embedding failed: {e}")
             return None
-            
-        current_time = time.time()
+
+    def get(self, vector: np.ndarray, context: tuple):
+        """Decision stored for the most similar message, if above the threshold"""
+        with self._lock:
+            if not self._size:
+                return None
+            scores = np.matmul(self._matrix[:self._size], vector, dtype=np.int32)
+            scores[self._contexts[:self._size] != hash(context)] = -1
+            best = int(np.argmax(scores))
+            if scores[best] < self.min_score:
+                return None
+            return dict(self._decisions[best])
+
+    def put(self, vector: np.ndarray, context: tuple, decision: dict):
+        with self._lock:
+            slot = self._next
+            self._matrix[slot] = vector
+            self._contexts[slot] = hash(context)
+            self._decisions[slot] = dict(decision)
+            self._next = (slot + 1) % len(self._decisions)
+            self._size = max(self._size, slot + 1)
+
+
+class BackendToolClassifier:
+    """
+    Backend AI that classifies user intent and decides which tool to call
+    This AI does NOT respond to user - it only decides actions
+    Uses Google Gemini API
+    """
+    
+    def __init__(self):
+        """
+        Initialize Backend Tool Classifier with Gemini
+        """
+        # genai is configured once for the process by settings
+        # Get model from env or use default
+        env_model = settings.google_model or "gemini-2.5-flash"
+        # Ensure model name has 'models/' prefix if not present (Gemini API often prefers it)
+        if not env_model.startswith("models/") and not env_model.startswith("gemini-"):
+             self.model_name = f"models/{env_model}"
+        else:
+             self.model_name = env_model
+             
+        self.cache_name = f"watchvine_cls_{_PROMPT_HASH}"
+        self.cached_content = None
+        self.last_cache_update = 0.0  # time.monotonic() of the last cache create/refresh
+        self._cached_model = None  # GenerativeModel bound to cached_content
+        # Used when caching is unavailable: sends the rules and the reference with every request
+        self._fallback_model = _get_shared_model(self.model_name)
+        self._cache_lock = threading.Lock()
+        self._cache_refreshing = False
+        self._cache_enabled = True  # Cleared by the warm-up when the prompt is below MIN_CACHE_TOKENS
+        # Cache usage reported by Gemini for calls on the cached model
+        self._cache_stats_lock = threading.Lock()
+        self._cache_hit_window = deque(maxlen=CACHE_HIT_WINDOW)
+        self._cache_recreated_for_misses = False
+        self._cache_disabled_until = 0.0  # time.monotonic() until which a missing cache stays dropped
+        self.cache_hits_total = 0
+        self.cache_misses_total = 0
+        self.cached_tokens_total = 0
+
+        # Rate limit tracking (phone -> monotonic ns of last request)
+        self._last_req_ns: "OrderedDict[str, int]" = OrderedDict()
+        self._rate_lock = threading.Lock()
+
+        # Decision LRU: (normalized message, has pending products, last bot reply) -> decision
+        self._decisions: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._decisions_lock = threading.Lock()
+        self._semantic_decisions = SemanticDecisionCache() if SEMCACHE_ENABLED else None
         
-        # specific name for the cache
-        cache_name = self.cache_name
+        # Create (or find) the context cache in the background so startup doesn't wait on Gemini
+        # and the first request doesn't pay for it
+        self._cache_warmup = _CACHE_POOL.submit(self._ensure_cache)
         
-        # If we have a valid local reference, return it
-        if self.cached_content and (current_time - self.last_cache_update < self.CACHE_TTL):
-            return self.cached_content
+        logger.info(f"✅ Backend Classifier initialized with Gemini ({self.model_name})")
 
+    def _get_rules_core(self) -> str:
+        """Returns the routing rules sent with every request"""
+        return _RULES_CORE
+
+    def _get_examples_corpus(self) -> str:
+        """Returns the reference material that is only ever sent inside the context cache"""
+        return _EXAMPLES_CORPUS
+
+    def _count_prompt_tokens(self) -> int:
+        """Token count of the cached prompt for this model (the rough estimate if counting fails)"""
+        tokens = _PROMPT_TOKENS.get(self.model_name)
+        if tokens is None:
+            try:
+                # Counted as plain contents on a bare model, so the fallback's system instruction isn't added twice
+                counter = genai.GenerativeModel(self.model_name)
+                tokens = counter.count_tokens([_RULES_CORE, _EXAMPLES_CORPUS]).total_tokens
+                _PROMPT_TOKENS[self.model_name] = tokens
+            except Exception as e:
+                logger.warning(f"⚠️ Token count failed, using estimate: {e}")
+                return _PROMPT_TOKEN_ESTIMATE
+        return tokens
+
+    def _ensure_cache(self, force_recreate: bool = False):
+        """
+        Creates or retrieves cached content for system instructions (blocking).
+        force_recreate skips the lookup and always creates a fresh cache.
+        """
         try:
-            # Check if cache exists (by iterating or specific name if API supported retrieval by name easily)
-            # For simplicity in this implementation, we'll try to create it. 
-            # If it exists, we might get an error or a new one. 
-            # Ideally we list and find.
-            
-            # Listing caches to find ours
-            existing_cache = None
-            for c in caching.CachedContent.list():
-                if c.display_name == cache_name:
-                    existing_cache = c
-                    break
+            prompt_tokens = self._count_prompt_tokens()
+            if prompt_tokens < MIN_CACHE_TOKENS:
+                # Too small to ever be cached: stay on standard requests for good
+                logger.info(f"⚠️ Content too small for caching ({prompt_tokens} tokens, need {MIN_CACHE_TOKENS}+)")
+                logger.info("✅ Using standard request (no cache)")
+                self._cache_enabled = False
+                return
+
+            existing_cache = None if force_recreate else self._find_existing_cache()
             
             if existing_cache:
-                # Update expiration? Or just use it.
-                # existing_cache.update(ttl=timedelta(hours=2))
                 logger.info(f"♻️ Using existing cache: {existing_cache.name}")
-                self.cached_content = existing_cache
+                cache = existing_cache
             else:
-                # Create new cache
-                system_instruction = self._get_static_instructions()
-                
-                # Estimate token count (rough: ~4 chars per token)
-                estimated_tokens = len(system_instruction) / 4
-                
-                # Only use cache if content is large enough (>1024 tokens required)
-                if estimated_tokens < 1000:
-                    logger.info(f"⚠️ Content too small for caching (~{int(estimated_tokens)} tokens, need 1024+)")
-                    logger.info("✅ Using standard request (no cache)")
-                    self.cached_content = None
-                else:
-                    logger.info(f"🆕 Creating new context cache (~{int(estimated_tokens)} tokens)...")
-                    self.cached_content = caching.CachedContent.create(
-                        model=self.model_name,
-                        display_name=cache_name,
-                        system_instruction=system_instruction,
-                        ttl=timedelta(hours=2) # Cache for 2 hours
-                    )
-                    logger.info(f"✅ Cache created: {self.cached_content.name}")
-            
-            self.last_cache_update = current_time
-            return self.cached_content
+                logger.info(f"🆕 Creating new context cache ({prompt_tokens} tokens)...")
+                cache = caching.CachedContent.create(
+                    model=self.model_name,
+                    display_name=self.cache_name,
+                    system_instruction=_RULES_CORE,
+                    contents=[_EXAMPLES_CORPUS],
+                    ttl=CACHE_SERVER_TTL
+                )
+                logger.info(f"✅ Cache created: {cache.name}")
             
+            if cache is not None:
+                self._share_cache_name(cache.name)
+            self.cached_content = cache
+            self._cached_model = _get_shared_model(self.model_name, cache) if cache else None
         except Exception as e:
             logger.error(f"❌ Cache operation failed: {e}")
-            return None
+            self.cached_content = None
+            self._cached_model = None
+        
+        self.last_cache_update = time.monotonic()
 
-    def analyze_and_classify(self, conversation_history: list, user_message: str, phone_number: str, search_context: dict = None) -> dict:
+    def _find_existing_cache(self):
         """
-        Analyze conversation and return tool decision in JSON format
-        Uses Smart Product Finder for natural language product searches
+        Live cache for the current instructions (matched by fingerprinted display name).
+        The cache recorded in CACHE_NAME_FILE is fetched with one GET; all caches are listed
+        only when there is no record or the GET fails.
         """
-        if not self.api_key:
-            logger.error("❌ No API Key")
-            return {"tool": "ai_chat"}
+        now = time.time()  # Wall clock: the record and expire_time are timestamps, not durations
+        min_expiry = now + 60
+        
+        def usable(c) -> bool:
+            return c.display_name == self.cache_name and c.expire_time.timestamp() > min_expiry
+        
+        try:
+            with open(CACHE_NAME_FILE) as f:
+                shared = json.load(f)
+            if now - shared["refreshed"] >= CACHE_SERVER_TTL.total_seconds():
+                return None  # Not extended within its TTL, so it has expired server-side
+            c = caching.CachedContent.get(shared["name"])
+            return c if usable(c) else None
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.debug(f"Shared cache record not usable: {e}")
+        
+        for c in caching.CachedContent.list():
+            if usable(c):
+                return c
+        return None
+
+    @staticmethod
+    def _share_cache_name(name: str):
+        """Record the cache name and when its TTL was last set, for sibling workers (best effort)"""
+        try:
+            with open(CACHE_NAME_FILE, "w") as f:
+                json.dump({"name": name, "refreshed": time.time()}, f)
+        except OSError as e:
+            logger.debug(f"Could not write {CACHE_NAME_FILE}: {e}")
+
+    def _refresh_cache(self):
+        """Extends the cache TTL (or recreates it if gone); runs on the cache pool"""
+        try:
+            if self.cached_content is not None:
+                try:
+                    self.cached_content.update(ttl=CACHE_SERVER_TTL)
+                    # Rebinds the model if a failed call dropped it
+                    self._cached_model = _get_shared_model(self.model_name, self.cached_content)
+                    self.last_cache_update = time.monotonic()
+                    self._share_cache_name(self.cached_content.name)
+                    logger.info(f"🔄 Cache TTL extended: {self.cached_content.name}")
+                    return
+                except Exception as e:
+                    logger.warning(f"⚠️ Cache refresh failed, recreating: {e}")
+            self._ensure_cache()
+        finally:
+            self._cache_refreshing = False
+
+    def _replace_cache(self, disable: bool):
+        """
+        Recreates the cache, or drops it and disables caching for CACHE_DISABLE_PERIOD (cache pool).
+        The old cache is left to expire: other instances and workers may still be bound to it.
+        """
+        try:
+            old_cache = self.cached_content
+            if disable:
+                self._cache_disabled_until = time.monotonic() + CACHE_DISABLE_PERIOD
+                self._cache_recreated_for_misses = False
+                self.cached_content = None
+                self._cached_model = None
+                self.last_cache_update = 0.0  # So the first call after the period recreates it
+            else:
+                self._ensure_cache(force_recreate=True)
+            if old_cache is not None and old_cache is not self.cached_content:
+                logger.info(f"⏳ Leaving old cache to expire: {old_cache.name}")
+        finally:
+            self._cache_refreshing = False
+
+    def _record_cache_usage(self, model, usage):
+        """
+        Counts cache hits from a call's usage metadata and reacts to a low hit rate.
+        Calls whose received chunks carried no usage metadata are not sampled.
+        """
+        if model is self._fallback_model or usage is None:
+            return
+        cached_tokens = getattr(usage, "cached_content_token_count", 0) or 0
+        with self._cache_stats_lock:
+            self._cache_hit_window.append(cached_tokens > 0)
+            if cached_tokens:
+                self.cache_hits_total += 1
+                self.cached_tokens_total += cached_tokens
+            else:
+                self.cache_misses_total += 1
+            if len(self._cache_hit_window) < CACHE_HIT_WINDOW:
+                return
+            hit_rate = sum(self._cache_hit_window) / CACHE_HIT_WINDOW
+            self._cache_hit_window.clear()
+
+        if hit_rate >= CACHE_MIN_HIT_RATE:
+            self._cache_recreated_for_misses = False
+            return
+        with self._cache_lock:
+            if self._cache_refreshing:
+                return
+            self._cache_refreshing = True
+        if self._cache_recreated_for_misses:
+            logger.error(
+                f"❌ Cache hit rate still {hit_rate:.0%} after recreating: disabling the context cache for "
+                f"{CACHE_DISABLE_PERIOD}s, every classification sends the full prompt until then"
+            )
+            _CACHE_POOL.submit(self._replace_cache, True)
+        else:
+            logger.warning(f"⚠️ Cache hit rate {hit_rate:.0%} over the last {CACHE_HIT_WINDOW} calls, recreating cache")
+            self._cache_recreated_for_misses = True
+            _CACHE_POOL.submit(self._replace_cache, False)
+
+    def cache_metrics(self) -> dict:
+        """Cumulative context-cache counters for the /metrics endpoint"""
+        with self._cache_stats_lock:
+            return {
+                "classifier_cache_hits_total": self.cache_hits_total,
+                "classifier_cache_miss_total": self.cache_misses_total,
+                "classifier_cached_tokens_total": self.cached_tokens_total,
+            }
+
+    def _get_or_create_cache(self):
+        """
+        Returns the model bound to the context cache (None if unavailable).
+        Never blocks on the network: a refresh due within a minute is started in the background.
+        """
+        if not self._cache_warmup.done():
+            try:
+                self._cache_warmup.result(timeout=CACHE_WARMUP_WAIT)
+            except FutureTimeoutError:
+                logger.warning("⚠️ Cache warm-up still running, using standard request")
+                return None
+        if not self._cache_enabled or time.monotonic() < self._cache_disabled_until:
+            return None
+        if time.monotonic() - self.last_cache_update > CACHE_REFRESH_INTERVAL - 60 and not self._cache_refreshing:
+            with self._cache_lock:
+                if not self._cache_refreshing:
+                    self._cache_refreshing = True
+                    _CACHE_POOL.submit(self._refresh_cache)
+        return self._cached_model
+
+    @staticmethod
+    def _normalize(message_lower: str) -> str:
+        """Collapse whitespace and drop trailing punctuation of a lowercased message"""
+        return re.sub(r"\s+", " ", message_lower).strip().rstrip(".,!?;: ")
+
+    @staticmethod
+    def _has_pending_products(search_context: dict) -> bool:
+        if not search_context:
+            return False
+        return search_context.get('total_found', 0) > search_context.get('sent_count', 0)
+
+    def _get_cached_decision(self, key: tuple):
+        with self._decisions_lock:
+            decision = self._decisions.get(key)
+            if decision is not None:
+                self._decisions.move_to_end(key)
+                return dict(decision)
+        return None
+
+    @staticmethod
+    def _is_cacheable_message(normalized: str) -> bool:
+        return normalized.count(' ') < DECISION_CACHE_MAX_WORDS
+
+    @staticmethod
+    def _payload_in_message(normalized: str, decision: dict) -> bool:
+        """True when every payload field of the decision can be read off the message itself"""
+        if not decision.keys() <= _MESSAGE_PAYLOAD_FIELDS:
+            return False
+        words = set(re.findall(r"\w+", normalized))
+        text = " ".join([str(decision.get('keyword') or ''), *map(str, decision.get('colors') or ())])
+        values = re.findall(r"\w+", text.lower())
+        values += [str(decision[field]) for field in ('min_price', 'max_price') if field in decision]
+        return all(value in words for value in values)
+
+    def _cache_decision(self, key: tuple, decision: dict, vector=None):
+        """
+        Remember decisions for short messages that don't carry a message-specific payload,
+        and product searches read entirely off the exact same message
+        """
+        if decision.get('tool') in _PAYLOAD_CACHEABLE_TOOLS:
+            if key[0].count(' ') >= DECISION_CACHE_MAX_PAYLOAD_WORDS or not self._payload_in_message(key[0], decision):
+                return
+            vector = None  # "rolex under 5000" must not answer "rolex under 6000"
+        elif not self._is_cacheable_message(key[0]) or decision.get('tool') not in _CACHEABLE_TOOLS or len(decision) > 1:
+            return
+        with self._decisions_lock:
+            self._decisions[key] = dict(decision)
+            self._decisions.move_to_end(key)
+            if len(self._decisions) > DECISION_CACHE_MAX:
+                self._decisions.popitem(last=False)
+        if vector is not None:
+            self._semantic_decisions.put(vector, key[1:], decision)
+
+    def _throttle(self, phone_number: str):
+        """Space requests from the same user at least MIN_REQUEST_INTERVAL_NS apart"""
+        with self._rate_lock:
+            now = time.monotonic_ns()
+            wait_ns = self._last_req_ns.get(phone_number, 0) + MIN_REQUEST_INTERVAL_NS - now
+            # Record the slot this request will actually use, so concurrent requests queue behind it
+            self._last_req_ns[phone_number] = now + max(wait_ns, 0)
+            self._last_req_ns.move_to_end(phone_number)
+            if len(self._last_req_ns) > RATE_LIMIT_MAX_USERS:
+                self._last_req_ns.popitem(last=False)
+        if wait_ns > 0:
+            time.sleep(wait_ns / 1e9)
+
+    def _select_model(self):
+        """The cached-content model when available, otherwise the full-prompt fallback"""
+        cached_model = self._get_or_create_cache()
+        if cached_model:
+            return cached_model
+        logger.warning("⚠️ Cache unavailable, using standard request")
+        return self._fallback_model
+
+    def _classify_locally(self, conversation_history: list, user_message: str, search_context: dict) -> tuple:
+        """
+        Decisions that don't need Gemini: overrides, cached decisions, style-only and plain brand requests.
+        Returns (decision or None, decision cache key, message embedding or None).
+        """
+        # Lowercased once; every local check below works on this copy
+        message_lower = user_message.lower()
 
         # CRITICAL OVERRIDE: Prevent "1", "2", "yes", "okay" from triggering show_more
         # These are used for Menu Options or Order Confirmation
-        input_clean = user_message.strip().lower()
-        if input_clean in ['1', '2', 'yes', 'okay', 'ha', 'haan', 'ok', 'sure', 'home delivery', 'pickup', 'store pickup']:
+        input_clean = message_lower.strip()
+        if input_clean in _CONFIRMATION_MESSAGES:
             logger.info(f"🚫 STRICT OVERRIDE: Input '{input_clean}' forced to ai_chat (Preventing show_more)")
-            return {"tool": "ai_chat"}
+            return {"tool": Tool.AI_CHAT}, None, None
+
+        normalized = self._normalize(message_lower)
+        has_pending = self._has_pending_products(search_context)
+        if normalized in _GREETINGS:
+            logger.info(f"👋 Greeting detected: '{normalized}'")
+            return {"tool": Tool.GREETING}, None, None
+        if normalized in _SHOW_MORE:
+            logger.info(f"➡️ Show-more request: '{normalized}' (pending products: {has_pending})")
+            return ({"tool": Tool.SHOW_MORE} if has_pending else {"tool": Tool.AI_CHAT}), None, None
+
+        # Short replies ("ok", "the second one") mean whatever the bot's last message asked
+        last_reply = next(
+            (msg.get('content', '') for msg in reversed(conversation_history or []) if msg.get('role') != 'user'),
+            ''
+        )
+        decision_key = (normalized, has_pending, last_reply)
+        cached_decision = self._get_cached_decision(decision_key)
+        if cached_decision:
+            logger.info(f"♻️ Cached Classifier Decision: {cached_decision}")
+            return cached_decision, decision_key, None
 
         # EARLY DETECTION: Check if this is a style-only request (no brand mentioned)
-        if self._is_style_only_request(user_message):
+        if self._is_style_only_request(message_lower):
             logger.warning(f"⚠️ Style-only request detected! User mentioned style but no brand.")
             logger.info(f"💬 Returning ai_chat to ask for category/brand selection")
             return {
-                "tool": "ai_chat",
+                "tool": Tool.AI_CHAT,
                 "response": "I understand you're looking for a specific style! To help you better, please tell me:\n\n1. What category? (Men's Watches, Ladies Watches, Bags, Shoes, Sunglasses, etc.)\n2. Any preferred brand? (e.g., Rolex, Fossil, Armani, Omega, Tommy Hilfiger, etc.)\n\nOr I can show you options from our top brands! 😊"
-            }
+            }, decision_key, None
 
         # Smart Product Finder is disabled - use direct classification for better gender/category detection
 
+        # Plain brand searches never need the model
+        fast_result = self._fast_classify(message_lower)
+        if fast_result:
+            logger.info(f"⚡ Fast-path Classifier Decision: {fast_result}")
+            return fast_result, decision_key, None
+
+        # Two prices and a category, no brand
+        range_result = self._extract_price_range(message_lower)
+        if range_result:
+            logger.info(f"💰 Price-range Classifier Decision: {range_result}")
+            return range_result, decision_key, None
+
+        # Paraphrases of short messages we've already classified
+        decision_vector = None
+        if self._semantic_decisions and self._is_cacheable_message(decision_key[0]):
+            decision_vector = self._semantic_decisions.embed(decision_key[0])
+            if decision_vector is not None:
+                similar_decision = self._semantic_decisions.get(decision_vector, decision_key[1:])
+                if similar_decision:
+                    logger.info(f"♻️ Similar-message Classifier Decision: {similar_decision}")
+                    return similar_decision, decision_key, decision_vector
+
+        return None, decision_key, decision_vector
+
+    @staticmethod
+    def _load_decision_json(result_text: str):
+        """Parse Gemini's JSON reply"""
+        result_text = result_text.strip()
+        # Cut away markdown code fences or any other text around the JSON object
+        _, brace, rest = result_text.partition("{")
+        body, close, _ = rest.rpartition("}")
+        if brace and close:
+            result_text = brace + body + close
+            
+        logger.info(f"🔍 Classifier Decision: {result_text}")
+        return _json_loads(result_text)
+
+    def _finish_decision(self, raw: dict, user_message: str, decision_key: tuple, decision_vector) -> dict:
+        """Turn a parsed Gemini decision into a cleaned one and remember it when cacheable"""
+        # Schema-constrained output lists every field; drop the nulls so callers' .get() defaults apply
+        result = {key: value for key, value in raw.items() if value is not None}
+        for field, enum_type in _ENUM_FIELDS.items():
+            if field in result:
+                try:
+                    result[field] = enum_type(result[field])
+                except ValueError:
+                    pass  # Keep unexpected values as plain strings
+        if isinstance(result.get('keyword'), str):
+            result['keyword'] = sys.intern(result['keyword'])
+        
+        # Post-processing: Validate and clean keyword extraction
+        result = self._validate_and_clean_keyword(result, user_message)
+        self._cache_decision(decision_key, result, decision_vector)
+        
+        return result
+
+    def _stream_decision(self, model, context_str: str) -> str:
+        """Gemini's reply text for one classification, read until the decision object is complete"""
+        response = model.generate_content(
+            context_str,
+            request_options={"timeout": CLASSIFY_TIMEOUT},
+            stream=True
+        )
+        scanner = _JsonObjectScanner()
+        usage = None
+        for chunk in response:
+            # Taken from the chunks actually read: the stream is abandoned before its last chunk
+            chunk_usage = getattr(chunk, "usage_metadata", None)
+            if getattr(chunk_usage, "prompt_token_count", 0):
+                usage = chunk_usage
+            if scanner.feed(chunk.text):
+                break
+        self._record_cache_usage(model, usage)
+        return scanner.text
+
+    def analyze_and_classify(self, conversation_history: list, user_message: str, phone_number: str, search_context: dict = None) -> dict:
+        """
+        Analyze conversation and return tool decision in JSON format
+        Uses Smart Product Finder for natural language product searches
+        """
+        decision, decision_key, decision_vector = self._classify_locally(conversation_history, user_message, search_context)
+        if decision:
+            return decision
+
         # Rate limiting
-        if phone_number in self.last_request_time:
-            time_since_last = time.time() - self.last_request_time[phone_number]
-            if time_since_last < self.min_request_interval:
-                time.sleep(self.min_request_interval - time_since_last)
-        self.last_request_time[phone_number] = time.time()
+        self._throttle(phone_number)
 
         # Build dynamic context
         context_str = self._build_context_string(conversation_history, user_message, search_context)
         
         try:
-            # Try to use cache
-            cached_content = self._get_or_create_cache()
-            
-            if cached_content:
-                # Use model with cache
-                model = genai.GenerativeModel.from_cached_content(cached_content=cached_content)
-                response = model.generate_content(
-                    context_str,
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=0.1,
-                        response_mime_type="application/json"
-                    )
-                )
-            else:
-                # Fallback to non-cached standard request
-                logger.warning("⚠️ Cache unavailable, using standard request")
-                model = genai.GenerativeModel(self.model_name)
-                full_prompt = self._get_static_instructions() + "\n\n" + context_str
-                response = model.generate_content(
-                    full_prompt,
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=0.1,
-                        response_mime_type="application/json"
-                    )
-                )
-            
-            # Parse result
-            result_text = response.text.strip()
-            # Clean up markdown code blocks if present
-            if result_text.startswith("```json"):
-                result_text = result_text[7:]
-            if result_text.startswith("```"):
-                result_text = result_text[3:]
-            if result_text.endswith("```"):
-                result_text = result_text[:-3]
-                
-            logger.info(f"🔍 Classifier Decision: {result_text}")
-            result = json.loads(result_text)
-            
-            # Post-processing: Validate and clean keyword extraction
-            result = self._validate_and_clean_keyword(result, user_message)
-            
-            return result
+            model = self._select_model()
+            try:
+                result_text = self._stream_decision(model, context_str)
+            except Exception as e:
+                if model is self._fallback_model:
+                    raise
+                # The cache may have expired or been replaced by another worker: stay uncached until the next refresh
+                logger.warning(f"⚠️ Cached model failed, retrying without cache: {e}")
+                self._cached_model = None
+                result_text = self._stream_decision(self._fallback_model, context_str)
+            raw = self._load_decision_json(result_text)
+            return self._finish_decision(raw, user_message, decision_key, decision_vector)
 
         except Exception as e:
             logger.error(f"❌ Classifier Error: {e}")
-            return {"tool": "ai_chat"}
-    
-    def _is_style_only_request(self, message: str) -> bool:
+            return {"tool": Tool.AI_CHAT}
+
+    def _fast_classify(self, message_lower: str) -> dict:
+        """
+        Classify "<brand> [gender] [product]" messages locally in one pass over the words.
+        Returns a find_product decision, or None when Gemini has to decide.
+        """
+        words = _WORD_RE.findall(message_lower)
+        brands, genders, products = set(), set(), set()
+        i, n = 0, len(words)
+        while i < n:
+            # Longest term first, so "tag heuer" wins over "tag"
+            for size in range(min(_FAST_TERM_MAX_WORDS, n - i), 0, -1):
+                term = _FAST_TERMS.get(' '.join(words[i:i + size]))
+                if term:
+                    break
+            else:
+                return None
+            kind, value = term
+            if kind == 'brand':
+                brands.add(value)
+            elif kind == 'gender':
+                genders.add(value)
+            elif kind == 'product':
+                products.add(value)
+            i += size
+
+        if len(brands) != 1 or len(genders) > 1 or len(products) > 1:
+            return None
+        brand = brands.pop()
+        gender = genders.pop() if genders else None
+        product = products.pop() if products else None
+
+        if product is None:
+            if brand in _NON_WATCH_BRANDS:
+                return None
+            product = 'watch'
+        if product in ('watch', 'sunglasses', 'shoes'):
+            if product != 'watch' and gender is None:
+                return None
+            category_key = CategoryKey(f"{gender or 'mens'}_{product}")
+        elif product == 'bag':
+            if gender == 'mens':
+                return None
+            category_key = CategoryKey.HANDBAG
+        else:
+            category_key = CategoryKey(product)
+
+        return {
+            "tool": Tool.FIND_PRODUCT, "keyword": brand, "category_key": category_key,
+            "min_price": None, "max_price": None, "belt_type": None, "colors": None
+        }
+
+    def _extract_price_range(self, message_lower: str) -> dict:
+        """
+        find_product_by_range decision for "<min> to <max> <category>" messages without a brand.
+        Returns None when Gemini has to decide (no range, no category, a brand, or min >= max).
+        """
+        price_match = _PRICE_RANGE_RE.search(message_lower)
+        if not price_match:
+            return None
+        category_match = _RANGE_CATEGORY_RE.search(message_lower)
+        if not category_match:
+            return None
+        min_price, max_price = int(price_match[1]), int(price_match[2])
+        if min_price >= max_price:
+            return None
+        if _find_brand(message_lower):
+            return None  # Brand + range is a find_product search
+        category = _RANGE_CATEGORIES[category_match[1]]
+        return {
+            "tool": Tool.FIND_PRODUCT_BY_RANGE, "category": category, "min_price": min_price,
+            "max_price": max_price, "product_name": f"₹{min_price}-₹{max_price} {category}"
+        }
+
+    def _is_style_only_request(self, message_lower: str) -> bool:
         """
         Check if message contains ONLY style/type words without any brand mention.
         Style words: professional, formal, casual, wedding, minimalistic, fancy, elegant, etc.
         
         Returns True if this is a style-based request without brand.
         """
-        style_keywords = {
-            'professional', 'formal', 'casual', 'wedding', 'minimalistic', 'fancy', 'elegant',
-            'vintage', 'modern', 'classic', 'sporty', 'luxury', 'simple', 'analog', 'digital',
-            'smartwatch', 'automatic', 'mechanical', 'quartz', 'dress', 'business', 'daily',
-            'occasion', 'special', 'unique', 'trendy', 'stylish', 'sleek', 'bold', 'minimal'
-        }
-        
-        brand_list = [
-            'armani exchange', 'tommy hilfiger', 'tag heuer', 'patek philippe', 'audemars piguet', 
-            'michael kors', 'louis vuitton', 'kate spade', 'tom ford', 'hugo boss', 'jaeger-lecoultre',
-            'fossil', 'tissot', 'armani', 'ax', 'tommy', 'rolex', 'rado', 'omega', 'tag', 
-            'patek', 'hublot', 'cartier', 'ap', 'mk', 'alix', 'naviforce', 'reward', 'casio', 
-            'gucci', 'coach', 'ysl', 'lv', 'prada', 'burberry', 'ray-ban', 'rayban', 'oakley', 
-            'versace', 'carrera', 'police', 'diesel', 'guess', 'seiko', 'citizen', 'longines',
-            'breitling', 'tudor', 'iwc', 'vacheron', 'zenith', 'tudor'
-        ]
-        
-        message_lower = message.lower()
-        
-        # Check if any brand is mentioned
-        for brand in brand_list:
-            if brand in message_lower:
+        # One pass over the message finds both brands and style words
+        has_style_keywords = False
+        for match in _KEYWORD_RE.finditer(message_lower):
+            if match.lastgroup == 'brand':
                 return False  # Brand found, so NOT style-only
-        
-        # Check if message contains style keywords
-        has_style_keywords = any(style in message_lower for style in style_keywords)
+            has_style_keywords = True
         
         if has_style_keywords:
-            logger.info(f"🎨 Style-only request detected (no brand): '{message}'")
+            logger.info(f"🎨 Style-only request detected (no brand): '{message_lower}'")
             return True
         
         return False
@@ -938,48 +1657,23 @@ Return ONLY JSON.
         Validate and clean keyword extraction to prevent full sentences from being used as keywords.
         If keyword looks like a full sentence (has spaces and common words), extract only the brand name.
         """
-        if result.get('tool') != 'find_product':
-            return result
-        
-        # safely handle None or missing keyword
+        # Most decisions aren't searches, and a search without a keyword has nothing to clean
         keyword = result.get('keyword')
-        if not keyword:
-            keyword = ''
+        if result.get('tool') != Tool.FIND_PRODUCT or not keyword:
+            return result
         keyword = str(keyword).strip()
         
-        # List of common brand names to look for (longer names first for priority)
-        brand_list = [
-            'armani exchange', 'tommy hilfiger', 'tag heuer', 'patek philippe', 'audemars piguet', 
-            'michael kors', 'louis vuitton', 'kate spade', 'tom ford', 'hugo boss',
-            'fossil', 'tissot', 'armani', 'ax', 'tommy', 'rolex', 'rado', 'omega', 'tag', 
-            'patek', 'hublot', 'cartier', 'ap', 'mk', 'alix', 'naviforce', 'reward', 'casio', 
-            'gucci', 'coach', 'ysl', 'lv', 'prada', 'burberry', 'ray-ban', 'rayban', 'oakley', 
-            'versace', 'carrera', 'police', 'diesel', 'guess', 'seiko', 'citizen', 'longines'
-        ]
-        
-        # Product type keywords to filter out
-        product_types = {'watch', 'watches', 'bag', 'bags', 'shoe', 'shoes', 'sunglass', 'sunglasses', 
-                        'wallet', 'wallets', 'bracelet', 'bracelets', 'glass', 'glasses'}
-        
         # Check if keyword looks like a full sentence or contains unwanted words
         words = keyword.split()
-        filler_words = {'mane', 'muje', 'chahiye', 'dikhao', 'joie', 'che', 'ke', 'ni', 
-                       'me', 'ne', 'show', 'vo', 'bata', 'aa', 'bai', 'do', 'go', 'for', 'the', 'a', 'an',
-                       'is', 'are', 'be', 'been', 'being', 'have', 'has', 'do', 'does', 'did'}
         
         # If keyword has 3+ words, it's definitely wrong
         if len(words) > 2:
             logger.warning(f"⚠️ Suspicious keyword detected (3+ words): '{keyword}'")
             
             # Search for brand names in user message
-            user_msg_lower = user_message.lower()
-            found_brand = None
-            
-            for brand in brand_list:
-                if brand in user_msg_lower:
-                    found_brand = brand
-                    logger.info(f"✅ Extracted brand from message: '{found_brand}'")
-                    break
+            found_brand = _find_brand(user_message.lower())
+            if found_brand:
+                logger.info(f"✅ Extracted brand from message: '{found_brand}'")
             
             if found_brand:
                 result['keyword'] = found_brand
@@ -987,7 +1681,7 @@ Return ONLY JSON.
             else:
                 # Try to extract first non-filler word as potential brand
                 for word in words:
-                    if word.lower() not in filler_words and len(word) > 2:
+                    if word.lower() not in _KEYWORD_FILLER_WORDS and len(word) > 2:
                         result['keyword'] = word.lower()
                         logger.info(f"🔧 Extracted first meaningful word: '{word.lower()}'")
                         break
@@ -997,17 +1691,17 @@ Return ONLY JSON.
             word1, word2 = words[0].lower(), words[1].lower()
             
             # Check if second word is a product type
-            if word2 in product_types:
+            if word2 in _KEYWORD_PRODUCT_TYPES:
                 # First word is probably the brand
                 result['keyword'] = word1
                 logger.info(f"🔧 Cleaned 2-word keyword: removed product type '{word2}' → '{word1}'")
             # Check if first word is a product type
-            elif word1 in product_types:
+            elif word1 in _KEYWORD_PRODUCT_TYPES:
                 # Second word is probably the brand
                 result['keyword'] = word2
                 logger.info(f"🔧 Cleaned 2-word keyword: removed product type '{word1}' → '{word2}'")
             # Check if it's actually a multi-word brand like "tommy hilfiger"
-            elif keyword in brand_list:
+            elif keyword in _BRAND_SET:
                 # Keep as is - it's a valid multi-word brand
                 logger.info(f"✅ Valid multi-word brand kept: '{keyword}'")
         
@@ -1016,14 +1710,11 @@ Return ONLY JSON.
     def _build_context_string(self, history: list, current_message: str, search_context: dict) -> str:
         """Builds the dynamic string for the request"""
         # Format history - increased to 30 messages for better context
-        hist_str = ""
-        for msg in history[-30:]:
-            role = msg.get('role', 'user')
-            content = msg.get('content', '')
-            hist_str += f"{role.upper()}: {content}\n"
+        lines = ["CONVERSATION HISTORY:"]
+        lines += [f"{msg.get('role', 'user').upper()}: {msg.get('content', '')}" for msg in history[-30:]]
+        lines.append("")
             
         # Format search info
-        search_info = ""
         if search_context:
             keyword = search_context.get('keyword', '')
             sent_count = search_context.get('sent_count', 0)
@@ -1032,19 +1723,19 @@ Return ONLY JSON.
             if keyword and total_found > 0:
                 remaining = total_found - sent_count
                 if remaining > 0:
-                    search_info = f"\n[SEARCH INFO - PENDING PRODUCTS]\nLast Search: '{keyword}'\nProducts Sent: {sent_count}/{total_found}\nRemaining: {remaining} products\nSTATUS: User has PENDING products from '{keyword}' search\n"
+                    lines += [
+                        "[SEARCH INFO - PENDING PRODUCTS]", f"Last Search: '{keyword}'",
+                        f"Products Sent: {sent_count}/{total_found}", f"Remaining: {remaining} products",
+                        f"STATUS: User has PENDING products from '{keyword}' search", ""
+                    ]
                 else:
-                    search_info = f"\n[SEARCH INFO - COMPLETE]\nLast Search: '{keyword}'\nAll {total_found} products already shown\nSTATUS: No pending products\n"
-
-        return f"""
-CONVERSATION HISTORY:
-{hist_str}
+                    lines += [
+                        "[SEARCH INFO - COMPLETE]", f"Last Search: '{keyword}'",
+                        f"All {total_found} products already shown", "STATUS: No pending products", ""
+                    ]
 
-{search_info}
-
-CURRENT MESSAGE:
-{current_message}
-"""
+        lines += ["CURRENT MESSAGE:", current_message, ""]
+        return "\n".join(lines)
 
     def extract_order_data_from_history(self, conversation_history: list, phone_number: str) -> dict:
         """
@@ -1065,8 +1756,7 @@ CURRENT MESSAGE:
         for msg in conversation_history:
             content = msg.get('content', '').lower()
             if 'http' in content:
-                 import re
-                 url = re.search(r'https?://[^\s]+', content)
+                 url = _URL_RE.search(content)
                  if url: order_data['product_url'] = url.group()
                  
         return order_data
\ No newline at end of file
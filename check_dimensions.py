@@ -1,4 +1,5 @@
 
+import asyncio
 import google.generativeai as genai
 import os
 from dotenv import load_dotenv
@@ -8,14 +9,26 @@ load_dotenv()
 api_key = os.getenv("Google_api")
 genai.configure(api_key=api_key)
 
-try:
-    # Try requesting 768 dimensions
-    result = genai.embed_content(
-        model="models/gemini-embedding-001",
-        content="Hello world",
-        task_type="retrieval_query",
-        output_dimensionality=768
-    )
-    print(f"SUCCESS: Generated embedding with length {len(result['embedding'])}")
-except Exception as e:
-    print(f"FAILED: {e}")
+# Output sizes probed in parallel; each probe gives up after PROBE_TIMEOUT seconds
+DIMENSIONS = (768, 1536, 3072)
+PROBE_TIMEOUT = 5
+
+async def probe_dimension(dimensions):
+    try:
+        result = await asyncio.wait_for(
+            genai.embed_content_async(
+                model="models/gemini-embedding-001",
+                content="Hello world",
+                task_type="retrieval_query",
+                output_dimensionality=dimensions
+            ),
+            PROBE_TIMEOUT
+        )
+        print(f"SUCCESS ({dimensions}): Generated embedding with length {len(result['embedding'])}")
+    except Exception as e:
+        print(f"FAILED ({dimensions}): {e!r}")
+
+async def main():
+    await asyncio.gather(*(probe_dimension(d) for d in DIMENSIONS))
+
+asyncio.run(main())
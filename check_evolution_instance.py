@@ -1,4 +1,5 @@
 
+import atexit
 import requests
 import json
 
@@ -8,11 +9,16 @@ headers = {
     "Content-Type": "application/json"
 }
 
+# One keep-alive connection for the listing and the test send
+session = requests.Session()
+session.headers.update(headers)
+atexit.register(session.close)
+
 output = []
 
 try:
     output.append(f"Checking URL: {url}")
-    response = requests.get(url, headers=headers, timeout=10)
+    response = session.get(url, timeout=10)
     output.append(f"List Instances Status: {response.status_code}")
     
     if response.status_code == 200:
@@ -35,7 +41,7 @@ try:
                         "text": "Antigravity Debug Test Message"
                     }
                     try:
-                        send_resp = requests.post(send_url, json=payload, headers=headers, timeout=10)
+                        send_resp = session.post(send_url, json=payload, timeout=10)
                         output.append(f"   Send Status: {send_resp.status_code}")
                         output.append(f"   Send Response: {send_resp.text[:200]}") # Truncate log
                     except Exception as e:
@@ -1,4 +1,5 @@
 
+import asyncio
 import google.generativeai as genai
 import os
 from dotenv import load_dotenv
@@ -12,11 +13,29 @@ if not api_key:
 
 genai.configure(api_key=api_key)
 
-print("Listing available models...")
-try:
-    for m in genai.list_models():
+# Each probe gives up after PROBE_TIMEOUT seconds so a hung call doesn't stall the others
+PROBE_TIMEOUT = 5
+
+async def probe_embedding_models():
+    print("Listing available models...")
+    # list_models pages through a blocking client, so it runs on a worker thread
+    models = await asyncio.wait_for(asyncio.to_thread(lambda: list(genai.list_models())), PROBE_TIMEOUT)
+    for m in models:
         if 'embedContent' in m.supported_generation_methods:
             print(f"Model Name: {m.name}")
             print(f"  Supported Methods: {m.supported_generation_methods}")
-except Exception as e:
-    print(f"Error listing models: {e}")
+
+async def probe_embed_call():
+    result = await asyncio.wait_for(
+        genai.embed_content_async(model="models/gemini-embedding-001", content="Hello world"),
+        PROBE_TIMEOUT
+    )
+    print(f"Embedding call OK (length {len(result['embedding'])})")
+
+async def main():
+    results = await asyncio.gather(probe_embedding_models(), probe_embed_call(), return_exceptions=True)
+    for name, result in zip(("Listing models", "Embedding call"), results):
+        if isinstance(result, BaseException):
+            print(f"Error in {name.lower()}: {result!r}")
+
+asyncio.run(main())
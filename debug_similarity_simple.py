@@ -1,24 +1,61 @@
 
 import os
 import math
+import numpy as np
 from pymongo import MongoClient
 import google.generativeai as genai
 from dotenv import load_dotenv
+from reindex_embeddings import quantize_int8
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; cosine_similarity falls back to numpy
+    njit = None
 
 load_dotenv()
 
 MONGODB_URI = os.getenv("MONGODB_URI")
 DB_NAME = os.getenv("MONGODB_DB", "watchvine_refined")
 GOOGLE_API_KEY = os.getenv("Google_api")
+# Queries compared against the stored product; all are embedded in one request
+TEST_QUERIES = ["rolex watch", "ladies watch", "black leather bag"]
+# Atlas vector index used by the bot's search (see GeminiVectorSearch._create_vector_index)
+VECTOR_INDEX = "vector_index"
+TOP_K = 5
 
-def dot_product(v1, v2):
-    return sum(a * b for a, b in zip(v1, v2))
+def _cosine_kernel(a, b):
+    """Dot product and both squared norms in one loop over contiguous float arrays"""
+    dot = norm_a = norm_b = 0.0
+    for i in range(a.shape[0]):
+        x = a[i]
+        y = b[i]
+        dot += x * y
+        norm_a += x * x
+        norm_b += y * y
+    return dot / math.sqrt(norm_a * norm_b)
 
-def magnitude(v):
-    return math.sqrt(sum(a * a for a in v))
+if njit is not None:
+    # cache=True keeps the compiled kernel in __pycache__, so later runs skip the JIT
+    _cosine_kernel = njit(cache=True, fastmath=True)(_cosine_kernel)
+    # Compile (or load from that cache) at import for the float32 signature cosine_similarity
+    # uses, so the comparison itself doesn't pay for it; WARMUP=0 skips this
+    if os.getenv("WARMUP", "1") == "1":
+        _warmup_vector = np.ones(768, dtype=np.float32)
+        _cosine_kernel(_warmup_vector, _warmup_vector)
 
 def cosine_similarity(v1, v2):
-    return dot_product(v1, v2) / (magnitude(v1) * magnitude(v2))
+    # float32 halves the memory traffic of the comparison; without numba it is a single BLAS dot
+    q = np.ascontiguousarray(v1, dtype=np.float32)
+    p = np.ascontiguousarray(v2, dtype=np.float32)
+    if njit is None:
+        return float(q @ p) / float(np.linalg.norm(q) * np.linalg.norm(p))
+    return _cosine_kernel(q, p)
+
+def int8_cosine_similarity(q_i8, p_i8):
+    """Cosine of two int8-quantized vectors (the scales cancel), accumulated in int32"""
+    q = np.frombuffer(q_i8, dtype=np.int8).astype(np.int32)
+    p = np.frombuffer(p_i8, dtype=np.int8).astype(np.int32)
+    return float(q @ p) / math.sqrt(float(q @ q) * float(p @ p))
 
 def debug_search():
     if not GOOGLE_API_KEY:
@@ -32,17 +69,16 @@ def debug_search():
         db = client[DB_NAME]
         collection = db['products']
         
-        print("\n--- 1. Generating Query Embedding (New Model) ---")
-        query = "rolex watch"
-        print(f"Query: '{query}'")
+        print("\n--- 1. Generating Query Embeddings (New Model) ---")
+        print(f"Queries: {TEST_QUERIES}")
         q_result = genai.embed_content(
             model="models/gemini-embedding-001",
-            content=query,
+            content=TEST_QUERIES,
             task_type="retrieval_query",
             output_dimensionality=768
         )
-        q_vec = q_result['embedding']
-        print(f"Query Vector Start: {q_vec[:3]}...")
+        q_vecs = q_result['embedding']
+        print(f"Query Vector Start: {q_vecs[0][:3]}...")
         
         print("\n--- 2. Inspecting Database Item ---")
         # Find a random product to check if it was updated
@@ -58,8 +94,17 @@ def debug_search():
                 # Old model typically produces values like 0.04... 
                 # New model values should be checked.
                 
-                score = cosine_similarity(q_vec, p_vec)
-                print(f"Similarity to Query: {score:.4f}")
+                scores = [cosine_similarity(q_vec, p_vec) for q_vec in q_vecs]
+                for query, score in zip(TEST_QUERIES, scores):
+                    print(f"Similarity to '{query}': {score:.4f}")
+                score = max(scores)
+                
+                # Quantization error of the int8 copy, when the product has one
+                p_i8 = doc.get('text_embedding_i8')
+                if p_i8:
+                    for query, q_vec in zip(TEST_QUERIES, q_vecs):
+                        i8_score = int8_cosine_similarity(quantize_int8(q_vec)[0], p_i8)
+                        print(f"Int8 similarity to '{query}': {i8_score:.4f}")
                 
                 if score < 0.3:
                     print("⚠️  LOW SIMILARITY - Embeddings might be mismatched (Old vs New model)")
@@ -69,6 +114,24 @@ def debug_search():
                 print("❌ No 'text_embedding' found in document!")
         else:
             print("❌ No products found in DB")
+        
+        print("\n--- 3. Server-side Vector Search ---")
+        # Atlas ranks every product against the query; only the top hits come back
+        for query, q_vec in zip(TEST_QUERIES, q_vecs):
+            hits = collection.aggregate([
+                {"$vectorSearch": {
+                    "index": VECTOR_INDEX,
+                    "path": "text_embedding",
+                    "queryVector": q_vec,
+                    "numCandidates": 200,
+                    "limit": TOP_K
+                }},
+                {"$project": {"_id": 0, "name": 1, "score": {"$meta": "vectorSearchScore"}}}
+            ])
+            print(f"Top {TOP_K} for '{query}':")
+            for hit in hits:
+                # Atlas reports cosine as (1 + cos) / 2
+                print(f"  {hit['score']:.4f}  {hit.get('name', 'Unknown')}")
 
     except Exception as e:
         print(f"Error: {e}")
@@ -6,19 +6,24 @@ Scrapes only watch products and compares with existing database
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
+import lxml.html
 import re
 import time
 import os
 import random
 import hashlib
 import secrets
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.server_api import ServerApi
 from urllib.parse import urljoin, urlparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
+from threading import Condition, Lock, local
 import signal
 import sys
+import atexit
 
 # --- CONFIGURATION ---
 DB_NAME = "watchvine_refined"
@@ -113,11 +118,11 @@ def generate_session_cookies():
     random_hash = secrets.token_hex(6)  # 12 character hex
     cookie_set_user = f"bs_{random_hash}"
     
-    # Generate ci_session (26 character alphanumeric)
-    ci_session = ''.join(random.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=26))
+    # Generate ci_session (26 character lowercase hex)
+    ci_session = secrets.token_hex(13)
     
     # AWS load balancer cookies - generate realistic looking values
-    aws_token = secrets.token_urlsafe(64)[:88]  # Similar length to real AWS cookies
+    aws_token = secrets.token_urlsafe(66)  # 88 characters, similar length to real AWS cookies
     
     cookies = {
         'store_session': str(current_timestamp),
@@ -132,7 +137,7 @@ def generate_session_cookies():
 
 def get_cookie_string(cookies_dict):
     """Convert cookie dict to cookie header string"""
-    return '; '.join([f"{k}={v}" for k, v in cookies_dict.items()])
+    return '; '.join(f"{k}={v}" for k, v in cookies_dict.items())
 
 # Category-wise URLs for accurate product categorization
 CATEGORIES = {
@@ -209,16 +214,47 @@ CATEGORIES = {
 }
 
 # Performance settings - Optimized for SPEED with stability
-MAX_WORKERS = 5  # Increased threads for faster scraping
-BATCH_SIZE = 100  # Save to DB every X products
+START_WORKERS = 2  # Concurrent product fetches at start; grows while the site keeps up
+MAX_WORKERS = 16  # Upper bound on concurrent product fetches
+WORKER_STEP_SUCCESSES = 50  # Add a worker after this many successes with no rate limiting
+BATCH_SIZE = 50  # Initial DB batch size; doubles after each clean write
+MAX_BATCH_SIZE = 500  # Largest DB batch
 REQUEST_TIMEOUT = 30  # Reduced timeout for faster failures
 RETRY_ATTEMPTS = 3  # Reduced retries for faster recovery
 RATE_LIMIT_DELAY = 0.5  # Minimal delay between requests (0.5-1 seconds)
 RETRY_DELAY_MIN = 3  # Reduced retry delay (seconds)
 RETRY_DELAY_MAX = 8  # Reduced maximum retry delay (seconds)
 EXPONENTIAL_BACKOFF = True  # Use exponential backoff on retries
-COOKIE_REFRESH_INTERVAL = 600  # Refresh cookies every 10 minutes (cookies expire in 3 days)
-REQUESTS_PER_COOKIE_CHECK = 50  # Check every 50 requests (less frequent)
+# Cookies (ci_session lasts 3 days) are only refreshed when the server rejects a request
+COOKIE_REJECTED_STATUSES = (401, 403, 419)
+
+# Patterns used on every page, compiled once
+_PRICE_AMT_RE = re.compile(r'₹\s?[\d,.]+')
+_CURRENCY_RE = re.compile(r'[₹|Rs|RS]')
+_CURRENCY_AMT_RE = re.compile(r'([₹|Rs|RS]\s?[\d,.]+)')
+_COL_XS_RE = re.compile(r'col-xs-6')
+_PRODUCT_HREF_RE = re.compile(r'watchvine01.cartpe.in/.*html')
+_CAT_IDS_RE = re.compile(r'cat_ids')
+_CAT_ID_RE = re.compile(r'cat_ids["\']?\s*[:=]\s*["\']?(\d+)')
+# web_token: "...", name="web_token" value="..." or data-token="..."
+_WEB_TOKEN_RE = re.compile(
+    r'(?:web_token["\']?\s*[:=]\s*|name="web_token"\s+value=|data-token["\']?\s*[:=]\s*)["\']([a-f0-9]{32,})["\']'
+)
+# EXSLT regex namespace for re:test() in lxml XPath queries
+_XPATH_NS = {'re': 'http://exslt.org/regular-expressions'}
+
+# Product image lookup: gallery containers (matched by class token), skipping any
+# div/section that holds one of the "other products" headings
+_IMAGE_CONTAINER_CLASSES = ('product-slider', 'owl-item', 'item', 'product-details-img',
+                            'product-gallery', 'image-gallery', 'product-images')
+_UNWANTED_SECTION = "*[self::div or self::section][{}]".format(" or ".join(
+    f"contains(., '{term}')" for term in ("Related Products", "Recently Viewed", "You may also like")))
+_IMAGE_CONTAINER = " or ".join(
+    f"contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')" for cls in _IMAGE_CONTAINER_CLASSES)
+_IMAGE_CONTAINER_XPATH = f"//div[{_IMAGE_CONTAINER}][not(ancestor-or-self::{_UNWANTED_SECTION})]"
+_CONTAINER_IMG_XPATH = f"//div[{_IMAGE_CONTAINER}]//img[not(ancestor::{_UNWANTED_SECTION})]"
+_PAGE_IMG_XPATH = f"//img[not(ancestor::{_UNWANTED_SECTION})]"
+_IMAGE_PATH_HINTS = ("/product/", "/images/", "uploads", "media", "gallery")
 
 # Global counters with thread-safe lock
 stats = {
@@ -231,6 +267,116 @@ stats_lock = Lock()
 products_buffer = []
 buffer_lock = Lock()
 
+# Product pages are fetched over one keep-alive session per worker thread, so consecutive
+# products reuse the same connection; a session is only replaced after a 403
+_thread_state = local()
+
+
+def _get_session():
+    """This thread's (session, user_agent), created on first use.
+    
+    Browser headers are built once and installed on the session, so every request from
+    it sends the same consistent set.
+    """
+    if getattr(_thread_state, 'session', None) is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS * 2, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        user_agent = random.choice(USER_AGENTS)
+        session.headers.update(get_random_headers(user_agent=user_agent))
+        _thread_state.session = session
+        _thread_state.user_agent = user_agent
+    return _thread_state.session, _thread_state.user_agent
+
+
+def _drop_session():
+    """Close this thread's session; the next _get_session() starts over with a new user agent"""
+    session = getattr(_thread_state, 'session', None)
+    _thread_state.session = None
+    if session is not None:
+        try:
+            session.close()
+        except Exception:
+            pass
+
+
+# One MongoClient (and connection pool) for the whole process, created on first use
+_mongo_client = None
+_mongo_lock = Lock()
+
+
+def _get_mongo():
+    """The shared MongoClient; closed when the process exits"""
+    global _mongo_client
+    with _mongo_lock:
+        if _mongo_client is None:
+            MONGO_URI = os.getenv("MONGODB_ATLAS_URI") or os.getenv("MONGODB_URI") or os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+            
+            # Use MongoDB Stable API for Atlas
+            if 'mongodb+srv://' in MONGO_URI:
+                _mongo_client = MongoClient(
+                    MONGO_URI,
+                    server_api=ServerApi('1'),
+                    maxPoolSize=MAX_WORKERS * 2,
+                    serverSelectionTimeoutMS=10000
+                )
+            else:
+                _mongo_client = MongoClient(MONGO_URI, maxPoolSize=MAX_WORKERS * 2, serverSelectionTimeoutMS=5000)
+            atexit.register(_mongo_client.close)
+        return _mongo_client
+
+
+class ConcurrencyController:
+    """Adaptive limit on how many products are fetched at once.
+    
+    Starts at START_WORKERS, adds one worker after every WORKER_STEP_SUCCESSES
+    successful fetches (up to the cap) and halves on any 429.
+    """
+    
+    def __init__(self, start=START_WORKERS, cap=MAX_WORKERS, step_successes=WORKER_STEP_SUCCESSES):
+        self.cap = cap
+        self.limit = min(start, cap)
+        self.step_successes = step_successes
+        self._successes = 0
+        self._in_flight = 0
+        self._cond = Condition()
+    
+    def run(self, fn, *args):
+        """Call fn(*args) once a slot is free under the current limit."""
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify()
+    
+    def record_success(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.step_successes and self.limit < self.cap:
+                self._successes = 0
+                self.limit += 1
+                print(f"⚙️  Site keeping up - now {self.limit} parallel fetches")
+                self._cond.notify()
+    
+    def record_rate_limited(self):
+        with self._cond:
+            self._successes = 0
+            if self.limit > 1:
+                self.limit = max(1, self.limit // 2)
+                print(f"⚙️  Rate limited - down to {self.limit} parallel fetches")
+
+
+concurrency_controller = ConcurrencyController()
+
+# Current DB batch size, adjusted by save_batch_to_db (callers hold buffer_lock)
+batch_size = BATCH_SIZE
+
 
 def signal_handler(sig, frame):
     """Handle Ctrl+C gracefully"""
@@ -244,23 +390,26 @@ def signal_handler(sig, frame):
 signal.signal(signal.SIGINT, signal_handler)
 
 
-def extract_price(soup):
-    """Enhanced price extraction."""
+def extract_price_lxml(root):
+    """Enhanced price extraction from an lxml.html root element."""
     price = "Price Not Found"
     
-    price_tag = soup.find(lambda tag: tag.name in ['h4', 'span', 'div', 'p'] and '₹' in tag.get_text())
+    # First h4/span/div/p (document order) whose text contains ₹, found in one XPath
+    matches = root.xpath("(//h4|//span|//div|//p)[contains(string(.), '₹')][1]")
     
-    if not price_tag:
-        price_tag = soup.find(class_=re.compile(r'price|current-price|product-price', re.I))
+    if not matches:
+        matches = root.xpath("//*[re:test(@class, 'price|current-price|product-price', 'i')][1]",
+                             namespaces=_XPATH_NS)
     
-    if price_tag:
-        raw_price = price_tag.get_text(separator=" ", strip=True)
-        strike = price_tag.find(['strike', 's', 'del']) or price_tag.find('span', style=re.compile(r'line-through'))
+    if matches:
+        price_el = matches[0]
+        raw_price = " ".join(price_el.text_content().split())
+        strike = price_el.xpath(".//strike|.//s|.//del|.//span[contains(@style, 'line-through')]")
         if strike:
-            strike_text = strike.get_text(strip=True)
+            strike_text = strike[0].text_content().strip()
             raw_price = raw_price.replace(strike_text, "").strip()
         
-        price_match = re.search(r'₹\s?[\d,.]+', raw_price)
+        price_match = _PRICE_AMT_RE.search(raw_price)
         if price_match:
             price = price_match.group(0).replace(" ", "").replace("₹", "").strip()
         else:
@@ -269,77 +418,84 @@ def extract_price(soup):
     return price
 
 
-def extract_images(soup, product_url):
-    """Enhanced image extraction with universal parser approach."""
+def extract_images(root, product_url):
+    """Enhanced image extraction with universal parser approach, from an lxml.html root element."""
     image_urls = []
+    seen = set()
     
-    # Remove unwanted sections
-    for unwanted in soup.find_all(['div', 'section']):
-        if any(term in unwanted.get_text() for term in ["Related Products", "Recently Viewed", "You may also like"]):
-            unwanted.decompose()
-    
-    # Look for product-specific containers first
-    containers = soup.find_all('div', class_=['product-slider', 'owl-item', 'item', 'product-details-img', 
-                                               'product-gallery', 'image-gallery', 'product-images'])
-    target_areas = containers if containers else [soup]
-    
-    for area in target_areas:
-        for img in area.find_all('img'):
-            # Try multiple image source attributes
-            src = img.get('data-src') or img.get('src') or img.get('data-lazy') or img.get('data-original')
-            if src:
-                full_url = urljoin(product_url, src)
-                # Filter out logos, icons, and duplicates
-                if ("logo" not in full_url.lower() and 
-                    "icon" not in full_url.lower() and
-                    full_url not in image_urls and
-                    any(x in full_url for x in ["/product/", "/images/", "uploads", "media", "gallery"])):
-                    image_urls.append(full_url)
+    # Product-specific containers first, whole page otherwise; images inside
+    # "Related Products" style sections are excluded by the XPath itself
+    if root.xpath(_IMAGE_CONTAINER_XPATH):
+        imgs = root.xpath(_CONTAINER_IMG_XPATH)
+    else:
+        imgs = root.xpath(_PAGE_IMG_XPATH)
+    
+    for img in imgs:
+        # Try multiple image source attributes
+        src = img.get('data-src') or img.get('src') or img.get('data-lazy') or img.get('data-original')
+        if src:
+            full_url = urljoin(product_url, src)
+            # Filter out logos, icons, and duplicates
+            url_lower = full_url.lower()
+            if ("logo" not in url_lower and 
+                "icon" not in url_lower and
+                full_url not in seen and
+                any(x in full_url for x in _IMAGE_PATH_HINTS)):
+                seen.add(full_url)
+                image_urls.append(full_url)
     
     return image_urls
 
 
+def _stripped_text(el):
+    """Text of an lxml element with each piece stripped and joined, like get_text(strip=True)."""
+    return "".join(t.strip() for t in el.itertext())
+
+
 def universal_product_parser(html_content):
     """Universal parser that finds products even if class names change.
     
     This is an alternative parsing method that's more resilient to HTML structure changes.
     """
-    soup = BeautifulSoup(html_content, 'html.parser')
+    root = lxml.html.fromstring(html_content)
     products = []
+    seen = set()
     
-    # Find all potential product containers
-    # Cartpe usually uses 'col-' based layout or 'item' classes
-    containers = soup.find_all(['div', 'li', 'a'], class_=True)
+    # Find the deepest potential product containers: classed div/li/a elements with no
+    # classed div/li below them. Cartpe usually uses 'col-' based layout or 'item' classes
+    containers = root.xpath("//*[self::div or self::li or self::a][@class]"
+                            "[not(.//div[@class] or .//li[@class])]")
     
     for box in containers:
-        # Skip parent containers - we only want the deepest product containers
-        if box.find(['div', 'li'], class_=True):
-            continue
-        
-        text = box.get_text(strip=True)
+        text = _stripped_text(box)
         
         # Check if this element contains a price (indicates it's a product)
-        if re.search(r'[₹|Rs|RS]', text):
+        if _CURRENCY_RE.search(text):
             try:
                 # Find product name: Usually in h3, h4, h5, p, or a tag
                 name = "Product"
-                name_elem = box.find(['h5', 'h4', 'h3', 'p', 'a'])
+                name_elem = box.xpath("(.//*[self::h5 or self::h4 or self::h3 or self::p or self::a])[1]")
                 if name_elem:
-                    name = name_elem.get_text(strip=True)
+                    name = _stripped_text(name_elem[0])
+                
+                # Keep only the first product with each name
+                if name in seen:
+                    continue
                 
                 # Find price
-                price_match = re.search(r'([₹|Rs|RS]\s?[\d,.]+)', text)
+                price_match = _CURRENCY_AMT_RE.search(text)
                 price = price_match.group(1) if price_match else "N/A"
                 
                 # Find product URL
-                link = box.find('a', href=True)
-                url = link['href'] if link else ""
+                link = box.xpath("(.//a[@href])[1]")
+                url = link[0].get('href') if link else ""
                 
                 # Find image
-                img = box.find('img')
-                img_url = img.get('src') or img.get('data-src') if img else ""
+                img = box.xpath("(.//img)[1]")
+                img_url = img[0].get('src') or img[0].get('data-src') if img else ""
                 
                 if name and len(name) > 3 and url:
+                    seen.add(name)
                     products.append({
                         "name": name,
                         "price": price,
@@ -349,33 +505,32 @@ def universal_product_parser(html_content):
             except:
                 continue
     
-    # Remove duplicates based on name
-    unique_products = list({p['name']: p for p in products}.values())
-    return unique_products
+    return products
 
 
 def scrape_single_product(product_data):
     """Scrape a single product (thread-safe) with intelligent retry and session management."""
     p_url, p_name, category_key, category_name, index, total = product_data
     
-    session = None
     try:
-        # Create a fresh session for this product
-        session = requests.Session()
-        user_agent = random.choice(USER_AGENTS)
+        # Reuse this thread's session (and its open connection)
+        session, _ = _get_session()
         
         # Fetch product page with retry and smart backoff
         response = None
         for attempt in range(RETRY_ATTEMPTS):
             try:
-                # Use consistent user agent for the session
-                headers = get_random_headers(user_agent=user_agent)
-                
-                response = session.get(p_url, headers=headers, timeout=REQUEST_TIMEOUT)
+                # Streamed so lxml can parse straight off the socket below; the session
+                # already carries this thread's headers and user agent
+                response = session.get(p_url, timeout=REQUEST_TIMEOUT, stream=True)
                 
                 if response.status_code == 200:
                     break
-                elif response.status_code == 403:
+                
+                # Not using this body; release the streamed connection
+                response.close()
+                
+                if response.status_code == 403:
                     # 403 Forbidden - use exponential backoff
                     if EXPONENTIAL_BACKOFF:
                         retry_delay = min(RETRY_DELAY_MAX, RETRY_DELAY_MIN * (2 ** attempt)) + random.uniform(0, 4)
@@ -385,12 +540,12 @@ def scrape_single_product(product_data):
                     print(f"   ⚠️  Product [{p_name[:30]}...] - 403 on attempt {attempt+1}/{RETRY_ATTEMPTS}, waiting {retry_delay:.1f}s")
                     time.sleep(retry_delay)
                     
-                    # Create new session with different user agent
-                    session.close()
-                    session = requests.Session()
-                    user_agent = random.choice(USER_AGENTS)
+                    # Create new session with different user agent and headers
+                    _drop_session()
+                    session, _ = _get_session()
                 elif response.status_code == 429:
-                    # Rate limited - wait longer
+                    # Rate limited - fewer parallel fetches, and wait longer
+                    concurrency_controller.record_rate_limited()
                     retry_delay = random.uniform(20, 30) * (attempt + 1)
                     print(f"   ⚠️  Product [{p_name[:30]}...] - 429 Rate Limited, waiting {retry_delay:.1f}s")
                     time.sleep(retry_delay)
@@ -413,11 +568,21 @@ def scrape_single_product(product_data):
         if response is None or response.status_code != 200:
             raise Exception(f"Failed after {RETRY_ATTEMPTS} attempts - status: {response.status_code if response else 'None'}")
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        # Decompress and parse in one pass without buffering the body in Python. libxml2 would
+        # read bytes without a <meta charset> as Latin-1 (mangling ₹), so pass the charset
+        # explicitly: the header's when it names one, else UTF-8 (requests' own default for
+        # a bare text/html is ISO-8859-1, which has the same problem)
+        if 'charset' in response.headers.get('Content-Type', '').lower():
+            encoding = response.encoding or 'utf-8'
+        else:
+            encoding = 'utf-8'
+        with response:
+            response.raw.decode_content = True
+            root = lxml.html.parse(response.raw, lxml.html.HTMLParser(encoding=encoding)).getroot()
         
         # Extract data
-        price = extract_price(soup)
-        image_urls = extract_images(soup, p_url)
+        price = extract_price_lxml(root)
+        image_urls = extract_images(root, p_url)
         
         result = {
             "name": p_name,
@@ -429,6 +594,8 @@ def scrape_single_product(product_data):
             "scraped_at": time.time()
         }
         
+        concurrency_controller.record_success()
+        
         # Update stats
         with stats_lock:
             stats['success'] += 1
@@ -444,7 +611,7 @@ def scrape_single_product(product_data):
             products_buffer.append(result)
             
             # Save batch if buffer is full
-            if len(products_buffer) >= BATCH_SIZE:
+            if len(products_buffer) >= batch_size:
                 save_batch_to_db(products_buffer.copy())
                 products_buffer.clear()
         
@@ -457,55 +624,36 @@ def scrape_single_product(product_data):
             stats['failed'] += 1
             print(f"[{stats['success'] + stats['failed']}/{total}] ✗ [{category_name}] {p_name[:40]}... | Error: {str(e)[:50]}")
         return None
-    finally:
-        # Always close session
-        if session:
-            try:
-                session.close()
-            except:
-                pass
 
 
 def save_batch_to_db(batch):
-    """Save a batch of products to MongoDB using upsert to handle duplicates."""
+    """Save a batch of products to MongoDB using upsert to handle duplicates.
+    
+    The batch size doubles after each clean write (up to MAX_BATCH_SIZE) and halves
+    when the write reports errors.
+    """
+    global batch_size
+    
     if not batch:
         return
     
     try:
-        MONGO_URI = os.getenv("MONGODB_ATLAS_URI") or os.getenv("MONGODB_URI") or os.getenv("MONGO_URI")
-        
-        # Use MongoDB Stable API for Atlas
-        from pymongo.server_api import ServerApi
-        
-        if 'mongodb+srv://' in MONGO_URI:
-            client = MongoClient(
-                MONGO_URI,
-                server_api=ServerApi('1'),
-                serverSelectionTimeoutMS=10000
-            )
-        else:
-            client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-        db = client[DB_NAME]
+        db = _get_mongo()[DB_NAME]
         products_col = db[COLLECTION_NAME]
         
-        # Use update_one with upsert to handle duplicates gracefully
-        # This will update existing products or insert new ones
-        updated = 0
-        inserted = 0
-        for product in batch:
-            result = products_col.update_one(
-                {'url': product['url']},  # Match by URL (unique field)
-                {'$set': product},         # Update all fields
-                upsert=True                # Insert if doesn't exist
-            )
-            if result.upserted_id:
-                inserted += 1
-            elif result.modified_count > 0:
-                updated += 1
-        
-        print(f"💾 Batch: {inserted} new, {updated} updated (total {len(batch)} products)")
+        # Upsert by URL (unique field) to handle duplicates gracefully: existing products are
+        # updated, new ones inserted. One unordered bulk_write sends the whole batch at once.
+        result = products_col.bulk_write(
+            [UpdateOne({'url': product['url']}, {'$set': product}, upsert=True) for product in batch],
+            ordered=False
+        )
         
-        client.close()
+        print(f"💾 Batch: {result.upserted_count} new, {result.modified_count} updated (total {len(batch)} products)")
+        batch_size = min(MAX_BATCH_SIZE, batch_size * 2)
+    except BulkWriteError as e:
+        batch_size = max(BATCH_SIZE, batch_size // 2)
+        print(f"❌ Batch write errors ({len(e.details.get('writeErrors', []))} of {len(batch)} products), "
+              f"batch size now {batch_size}")
     except Exception as e:
         print(f"❌ Error saving batch to DB: {e}")
 
@@ -516,7 +664,7 @@ def get_category_id(category_url):
         headers = get_random_headers()
         response = requests.get(category_url, headers=headers, timeout=60)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = BeautifulSoup(response.content, 'lxml')
         
         # Look for the category ID in scripts or hidden inputs
         # Method 1: Check for hidden input with cat_id
@@ -526,14 +674,14 @@ def get_category_id(category_url):
         
         # Method 2: Check in the URL or page source for category ID patterns
         page_source = str(soup)
-        cat_id_match = re.search(r'cat_ids["\']?\s*[:=]\s*["\']?(\d+)', page_source)
+        cat_id_match = _CAT_ID_RE.search(page_source)
         if cat_id_match:
             return cat_id_match.group(1)
         
         # Method 3: Extract from the load more button/script
-        load_more_script = soup.find_all('script', string=re.compile(r'cat_ids'))
+        load_more_script = soup.find_all('script', string=_CAT_IDS_RE)
         for script in load_more_script:
-            cat_id_match = re.search(r'cat_ids["\']?\s*[:=]\s*["\']?(\d+)', script.string)
+            cat_id_match = _CAT_ID_RE.search(script.string)
             if cat_id_match:
                 return cat_id_match.group(1)
         
@@ -545,7 +693,10 @@ def get_category_id(category_url):
 
 
 def refresh_session_cookies(session, category_url, user_agent):
-    """Refresh session by visiting category page to get fresh cookies from server.
+    """Refresh session cookies from server.
+    
+    Tries a cheap HEAD of the base URL first and only falls back to a full GET
+    of the category page if the HEAD is rejected.
     
     Returns:
         bool: True if refresh successful, False otherwise
@@ -556,16 +707,20 @@ def refresh_session_cookies(session, category_url, user_agent):
         # Create new headers for this request
         headers = get_random_headers(user_agent=user_agent)
         
-        # Visit category page to get fresh cookies
-        response = session.get(category_url, headers=headers, timeout=30)
+        # HEAD carries Set-Cookie without the page body
+        response = session.head(BASE_URL, headers=headers, timeout=30, allow_redirects=True)
+        
+        if response.status_code != 200:
+            # Visit category page to get fresh cookies
+            response = session.get(category_url, headers=headers, timeout=30)
         
         if response.status_code == 200:
             print(f"   ✅ Cookies refreshed successfully: {len(session.cookies)} cookies")
             for cookie in session.cookies:
                 print(f"      - {cookie.name}: {cookie.value[:20]}...")
             return True
-        elif response.status_code == 403:
-            print(f"   ⚠️  Got 403 while refreshing cookies")
+        elif response.status_code in COOKIE_REJECTED_STATUSES:
+            print(f"   ⚠️  Got {response.status_code} while refreshing cookies")
             return False
         else:
             print(f"   ⚠️  Unexpected status {response.status_code} while refreshing")
@@ -586,19 +741,8 @@ def extract_web_token(html_content):
         str: Extracted web_token or None if not found
     """
     try:
-        # Regex for common web_token patterns
-        # Pattern 1: web_token: "..." or web_token = "..."
-        match = re.search(r'web_token["\']?\s*[:=]\s*["\']([a-f0-9]{32,})["\']', html_content)
-        if match:
-            return match.group(1)
-        
-        # Pattern 2: name="web_token" value="..."
-        match = re.search(r'name="web_token"\s+value="([a-f0-9]{32,})"', html_content)
-        if match:
-            return match.group(1)
-        
-        # Pattern 3: data-token or similar attributes
-        match = re.search(r'data-token["\']?\s*[:=]\s*["\']([a-f0-9]{32,})["\']', html_content)
+        # One scan for any of the known web_token patterns
+        match = _WEB_TOKEN_RE.search(html_content)
         if match:
             return match.group(1)
             
@@ -608,11 +752,16 @@ def extract_web_token(html_content):
         return None
 
 
+# Digests of load-more responses that held no products, shared by all categories in a run
+_empty_load_more_hashes = set()
+
+
 def create_fresh_session(category_url):
     """Create a completely fresh session with cookies and web_token from server.
     
     Returns:
-        tuple: (session, user_agent, web_token) or (None, None, None) if failed
+        tuple: (session, user_agent, web_token, html) or (None, None, None, None) if failed.
+            html is the category page body, so callers can parse it without fetching again.
     """
     try:
         session = requests.Session()
@@ -634,21 +783,22 @@ def create_fresh_session(category_url):
             else:
                 print(f"   ⚠️  Could not extract web_token from page")
             
-            return session, user_agent, web_token
+            return session, user_agent, web_token, response.content
         else:
             print(f"   ⚠️  Got status {response.status_code}")
             session.close()
-            return None, None, None
+            return None, None, None, None
             
     except Exception as e:
         print(f"   ⚠️  Error creating fresh session: {e}")
-        return None, None, None
+        return None, None, None, None
 
 
 def scrape_category(category_key, category_info, limit_per_category=None):
     """Scrape ALL products from a specific category using load more API with session.
     
-    Enhanced with intelligent cookie refresh mechanism and dynamic web_token extraction.
+    Cookies are refreshed only when a load-more request is rejected, and the web_token is
+    extracted dynamically from the category page.
     """
     category_name = category_info['name']
     category_url = urljoin(BASE_URL, category_info['url'])
@@ -660,17 +810,11 @@ def scrape_category(category_key, category_info, limit_per_category=None):
     print(f"📋 Slug: {category_slug}")
     print(f"{'='*80}\n")
     
-    # Track cookie age to proactively refresh
-    session_start_time = time.time()
-    last_cookie_refresh = session_start_time
-    # Note: ci_session cookie expires after 3 DAYS (259200 seconds)
-    # We refresh every 10 minutes to be safe, but cookies won't expire during scraping
-    
     # Create initial session and get cookies + web_token from server
     print(f"🔑 Creating fresh session and extracting web_token...")
     time.sleep(random.uniform(0.5, 1))  # Minimal delay
     
-    session, user_agent, web_token = create_fresh_session(category_url)
+    session, user_agent, web_token, initial_html = create_fresh_session(category_url)
     if not session:
         print(f"❌ Failed to create initial session for {category_name}")
         return []
@@ -686,12 +830,11 @@ def scrape_category(category_key, category_info, limit_per_category=None):
         for cookie in session.cookies:
             print(f"   - {cookie.name}: {cookie.value[:20]}...")
         
-        # Parse initial page
-        response = session.get(category_url, timeout=60)
-        soup = BeautifulSoup(response.content, 'html.parser')
+        # Parse initial page (already fetched by create_fresh_session)
+        soup = BeautifulSoup(initial_html, 'lxml')
         
         # Find all product divs from initial page
-        all_divs = soup.find_all('div', class_=re.compile(r'col-xs-6'))
+        all_divs = soup.find_all('div', class_=_COL_XS_RE)
         initial_count = len(all_divs)
         print(f"✅ Initial page: {initial_count} products loaded")
         
@@ -700,20 +843,9 @@ def scrape_category(category_key, category_info, limit_per_category=None):
         max_attempts = 3
         consecutive_failures = 0
         max_consecutive_failures = 2  # Allow 2 consecutive failures before giving up
-        request_count = 0  # Track number of requests made
+        last_hash = None  # blake2b digest of the previous load-more response
         
         while True:
-            # PROACTIVE COOKIE REFRESH - refresh before they expire!
-            current_time = time.time()
-            time_since_last_refresh = current_time - last_cookie_refresh
-            
-            # Refresh cookies every 10 minutes OR every 50 requests
-            if time_since_last_refresh >= COOKIE_REFRESH_INTERVAL or (request_count > 0 and request_count % REQUESTS_PER_COOKIE_CHECK == 0):
-                print(f"🔄 Proactive cookie refresh (age: {time_since_last_refresh:.0f}s, requests: {request_count})...")
-                if refresh_session_cookies(session, category_url, user_agent):
-                    last_cookie_refresh = current_time
-                    time.sleep(random.uniform(0.3, 0.7))  # Minimal wait after refresh
-            
             print(f"📥 Loading more products from offset {offset}...")
             
             # Minimal delay between load more requests
@@ -735,8 +867,6 @@ def scrape_category(category_key, category_info, limit_per_category=None):
             
             for attempt in range(max_attempts):
                 try:
-                    request_count += 1
-                    
                     # Minimal delay before request
                     time.sleep(random.uniform(0.2, 0.5))
                     
@@ -766,13 +896,13 @@ def scrape_category(category_key, category_info, limit_per_category=None):
                         timeout=60
                     )
                     
-                    # Check for 403
-                    if r.status_code == 403:
-                        print(f"   ⚠️  Attempt {attempt + 1}/{max_attempts}: 403 Forbidden")
+                    # Server rejected our cookies - refresh them now and retry
+                    if r.status_code in COOKIE_REJECTED_STATUSES:
+                        print(f"   ⚠️  Attempt {attempt + 1}/{max_attempts}: {r.status_code} rejected")
                         
                         # If all attempts exhausted, stop
                         if attempt >= max_attempts - 1:
-                            print(f"⚠️  403 Forbidden after {max_attempts} attempts - stopping load_more for this category")
+                            print(f"⚠️  {r.status_code} after {max_attempts} attempts - stopping load_more for this category")
                             consecutive_failures += 1
                             break
                         
@@ -786,7 +916,6 @@ def scrape_category(category_key, category_info, limit_per_category=None):
                         
                         # Try refreshing existing session first
                         if refresh_session_cookies(session, category_url, user_agent):
-                            last_cookie_refresh = time.time()
                             time.sleep(random.uniform(0.5, 1))
                             continue  # Retry with refreshed cookies
                         
@@ -794,14 +923,13 @@ def scrape_category(category_key, category_info, limit_per_category=None):
                         print(f"   🔄 Cookie refresh failed, creating new session...")
                         session.close()
                         
-                        new_session, new_user_agent, new_web_token = create_fresh_session(category_url)
+                        new_session, new_user_agent, new_web_token, _ = create_fresh_session(category_url)
                         if new_session:
                             session = new_session
                             user_agent = new_user_agent
                             if new_web_token:
                                 web_token = new_web_token  # Update token if extracted
                                 print(f"   🔑 Updated web_token: {web_token[:20]}...")
-                            last_cookie_refresh = time.time()
                             time.sleep(random.uniform(0.5, 1))
                             continue  # Retry with new session
                         else:
@@ -812,11 +940,21 @@ def scrape_category(category_key, category_info, limit_per_category=None):
                     r.raise_for_status()
                     
                     # SUCCESS - Update cookies from response automatically handled by session
+                    # A repeat of the previous page or of a known-empty page means the end,
+                    # no need to parse it
+                    content_hash = hashlib.blake2b(r.content, digest_size=16).digest()
+                    if content_hash == last_hash or content_hash in _empty_load_more_hashes:
+                        print(f"✅ No more products available. Total loaded: {len(all_divs)}")
+                        loaded_in_this_iteration = False
+                        break  # Exit loop - no more products
+                    last_hash = content_hash
+                    
                     # Parse response
-                    soup = BeautifulSoup(r.content, 'html.parser')
-                    divs = soup.find_all('div', class_=re.compile(r'col-xs-6'))
+                    soup = BeautifulSoup(r.content, 'lxml')
+                    divs = soup.find_all('div', class_=_COL_XS_RE)
                     
                     if not divs or len(divs) == 0:
+                        _empty_load_more_hashes.add(content_hash)
                         print(f"✅ No more products available. Total loaded: {len(all_divs)}")
                         loaded_in_this_iteration = False
                         break  # Exit loop - no more products
@@ -878,7 +1016,7 @@ def scrape_category(category_key, category_info, limit_per_category=None):
         products = []
         for div in all_divs:
             try:
-                link_tag = div.find('a', href=re.compile(r'watchvine01.cartpe.in/.*html'))
+                link_tag = div.find('a', href=_PRODUCT_HREF_RE)
                 if not link_tag:
                     continue
                 p_url = link_tag['href']
@@ -992,10 +1130,8 @@ def scrape_all_products(limit_per_category=None, clear_db=False, specific_catego
     print("="*80)
     
     # Connect to MongoDB - Use Atlas for products
-    MONGO_URI = os.getenv("MONGODB_ATLAS_URI") or os.getenv("MONGODB_URI") or os.getenv("MONGO_URI", "mongodb://localhost:27017/")
     print(f"📡 Connecting to MongoDB...")
-    client = MongoClient(MONGO_URI)
-    db = client[DB_NAME]
+    db = _get_mongo()[DB_NAME]
     products_col = db[COLLECTION_NAME]
     
     # Check existing products
@@ -1046,8 +1182,8 @@ def scrape_all_products(limit_per_category=None, clear_db=False, specific_catego
             time.sleep(wait_time)
     
     print(f"\n✅ Total products found across all categories: {len(all_products)}")
-    print(f"⚙️  Using {MAX_WORKERS} parallel threads")
-    print(f"💾 Saving in batches of {BATCH_SIZE}")
+    print(f"⚙️  Using {START_WORKERS}-{MAX_WORKERS} parallel threads (adaptive)")
+    print(f"💾 Saving in batches of {BATCH_SIZE}-{MAX_BATCH_SIZE} (adaptive)")
     print(f"\n{'='*80}")
     print("Starting detailed scrape...\n")
     
@@ -1059,9 +1195,13 @@ def scrape_all_products(limit_per_category=None, clear_db=False, specific_catego
     stats['total'] = len(products_to_scrape)
     stats['start_time'] = time.time()
     
-    # Parallel scraping
+    # Parallel scraping: the pool has MAX_WORKERS threads, the controller decides how
+    # many of them fetch at once
+    global concurrency_controller
+    concurrency_controller = ConcurrencyController(cap=MAX_WORKERS)
     with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [executor.submit(scrape_single_product, product) for product in products_to_scrape]
+        futures = [executor.submit(concurrency_controller.run, scrape_single_product, product)
+                   for product in products_to_scrape]
         
         # Wait for completion
         for future in as_completed(futures):
@@ -1137,8 +1277,6 @@ def scrape_all_products(limit_per_category=None, clear_db=False, specific_catego
         print(f"   Sold Out Removed: {comparison_result['removed_products']}")
         print(f"   Database After: {comparison_result['final_count']}")
     
-    client.close()
-    
     return all_products
 
 
@@ -1148,7 +1286,7 @@ def main(limit_per_category=None, clear_db=False, workers=None, categories=None)
     Args:
         limit_per_category: Max products per category (None = all products)
         clear_db: Whether to clear existing MongoDB data (default: False)
-        workers: Number of parallel threads (default: use MAX_WORKERS)
+        workers: Maximum number of parallel threads (default: use MAX_WORKERS)
         categories: List of specific category keys to scrape (None = all categories)
     """
     global MAX_WORKERS
@@ -1161,7 +1299,7 @@ def main(limit_per_category=None, clear_db=False, workers=None, categories=None)
     print("="*80)
     print(f"Products per category: {limit_per_category if limit_per_category else 'ALL'}")
     print(f"Clear database: {'Yes' if clear_db else 'No'}")
-    print(f"Parallel threads: {MAX_WORKERS}")
+    print(f"Parallel threads: up to {MAX_WORKERS}")
     if categories:
         print(f"Specific categories: {', '.join(categories)}")
     else:
@@ -1211,7 +1349,7 @@ if __name__ == '__main__':
         clear_input = input("Clear existing data in MongoDB? (y/N): ").strip().lower()
         clear_db = clear_input == 'y'
         
-        workers_input = input(f"Number of parallel threads (default {MAX_WORKERS}): ").strip()
+        workers_input = input(f"Maximum parallel threads (default {MAX_WORKERS}): ").strip()
         workers = int(workers_input) if workers_input else None
         
         categories_input = input("Specific categories (comma-separated keys, Enter for all): ").strip()
@@ -9,17 +9,21 @@ import time
 from flask import Flask, request, jsonify
 from datetime import datetime
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 from dotenv import load_dotenv
-import google.generativeai as genai
 
 # Import custom modules
-from agent_orchestrator import AgentOrchestrator, ConversationState
+from agent_orchestrator import (
+    AgentOrchestrator, ConversationState, STATE_NAMES,
+    ASK_ADDRESS_MSG, ASK_CORRECTIONS_MSG, ORDER_SAVE_FAILED_MSG
+)
 from backend_tool_classifier import BackendToolClassifier
 from google_sheets_handler import GoogleSheetsHandler, MongoOrderStorage
 from google_apps_script_handler import GoogleAppsScriptHandler
 from gemini_vector_search import GeminiVectorSearch
-from whatsapp_helper import send_whatsapp_message, send_whatsapp_media
+from whatsapp_helper import send_whatsapp_message, send_whatsapp_media, send_typing_indicator, prepare_whatsapp_text
 from monitoring import BotMonitor
+from settings import settings
 
 # Load environment variables
 load_dotenv()
@@ -35,8 +39,9 @@ logger = logging.getLogger(__name__)
 # CONFIGURATION
 # ============================================================================
 
-GOOGLE_API_KEY = os.getenv("Google_api")
-GOOGLE_MODEL = os.getenv("google_model", "gemini-2.5-flash")
+# Gemini key/model come from settings (validated and genai.configure'd once at import)
+GOOGLE_API_KEY = settings.google_api_key
+GOOGLE_MODEL = settings.google_model or "gemini-2.5-flash"
 # Local MongoDB for conversations
 MONGODB_URI = os.getenv("MONGODB_URI")
 MONGODB_DB = os.getenv("MONGODB_DB", "watchvine_refined")
@@ -54,13 +59,13 @@ INSTANCE_NAME = os.getenv("INSTANCE_NAME", "shop-bot")
 STORE_WEBSITE_URL = os.getenv("STORE_WEBSITE_URL", "https://watchvine01.cartpe.in/")
 STORE_CONTACT_NUMBER = os.getenv("STORE_CONTACT_NUMBER", "+91 90162 20667")
 
-if not GOOGLE_API_KEY:
-    logger.error("⚠️ Google_api not set! AI features will fail.")
-    exit(1)
-
-genai.configure(api_key=GOOGLE_API_KEY)
 logger.info(f"✅ Using Google Model: {GOOGLE_MODEL}")
 
+# Static order-flow replies, JSON/UTF-8 encoded once for the WhatsApp sender
+ASK_ADDRESS_PAYLOAD = prepare_whatsapp_text(ASK_ADDRESS_MSG)
+ASK_CORRECTIONS_PAYLOAD = prepare_whatsapp_text(ASK_CORRECTIONS_MSG)
+ORDER_SAVE_FAILED_PAYLOAD = prepare_whatsapp_text(ORDER_SAVE_FAILED_MSG)
+
 # ============================================================================
 # MONGODB CONNECTION
 # ============================================================================
@@ -91,9 +96,31 @@ class ConversationManager:
         self.search_cache.create_index("expires_at")
         self.processed_messages.create_index("message_id", unique=True)
         self.processed_messages.create_index("timestamp", expireAfterSeconds=86400)  # Auto-delete after 24h
+        self._create_product_cache_indexes()
         
         logger.info("✅ MongoDB connected")
 
+    def _create_product_cache_indexes(self):
+        """Unique phone_number and TTL indexes on product_cache, removing duplicate caches first if needed"""
+        product_cache = self.db.product_cache
+        try:
+            product_cache.create_index("phone_number", unique=True)
+        except OperationFailure as e:
+            if e.code != 11000:
+                raise
+            # Older deployments may hold several caches per user; keep only the newest
+            stale_ids = []
+            for group in product_cache.aggregate([
+                {"$sort": {"timestamp": -1}},
+                {"$group": {"_id": "$phone_number", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+                {"$match": {"count": {"$gt": 1}}}
+            ], allowDiskUse=True):
+                stale_ids.extend(group["ids"][1:])
+            product_cache.delete_many({"_id": {"$in": stale_ids}})
+            logger.warning(f"⚠️ Removed {len(stale_ids)} duplicate product caches before creating unique index")
+            product_cache.create_index("phone_number", unique=True)
+        product_cache.create_index("expires_at", expireAfterSeconds=0)  # Auto-delete at expires_at
+
     def get_conversation(self, phone_number: str, limit: int = 10):
         """Get conversation history"""
         try:
@@ -302,7 +329,7 @@ conversation_manager = ConversationManager(MONGODB_URI, MONGODB_DB)
 vector_search = GeminiVectorSearch(MONGODB_ATLAS_URI, GOOGLE_API_KEY, collection_name="products", db_name=MONGODB_ATLAS_DB)
 product_search_handler = ProductSearchHandler(vector_search)
 backend_classifier = BackendToolClassifier()
-orchestrator = AgentOrchestrator(conversation_manager)
+orchestrator = AgentOrchestrator(conversation_manager, product_collection=vector_search.collection)
 bot_monitor = BotMonitor(MONGODB_URI, MONGODB_DB)
 
 # Initialize order storage
@@ -340,6 +367,15 @@ def stats():
         logger.error(f"Error getting stats: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Classifier counters in Prometheus text format"""
+    lines = []
+    for name, value in backend_classifier.cache_metrics().items():
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n", 200, {"Content-Type": "text/plain; version=0.0.4"}
+
 @app.route('/dashboard', methods=['GET'])
 def dashboard():
     """Simple monitoring dashboard"""
@@ -928,7 +964,7 @@ Would you like to order this?"""
         
         if user_state.name == 'COLLECTING_DETAILS' or user_state.name == 'AWAITING_FINAL_CONFIRMATION':
             # User is providing order details (name, address) or confirming
-            logger.info(f"📝 User in order collection state: {user_state.value}")
+            logger.info(f"📝 User in order collection state: {STATE_NAMES.get(user_state, user_state)}")
             
             user_order = orchestrator.get_order_data(phone_number)
             
@@ -954,21 +990,20 @@ We will contact you soon!
                         
                         send_whatsapp_message(phone_number, response)
                         
-                        # Clear order data
+                        # Clear order data (order object is returned to the pool, keep the ID)
+                        order_id = user_order.order_id
                         orchestrator.clear_user_data(phone_number)
                         orchestrator.set_user_state(phone_number, orchestrator.ConversationState.ORDER_PLACED)
                         
-                        return jsonify({"status": "success", "order_id": user_order.order_id}), 200
+                        return jsonify({"status": "success", "order_id": order_id}), 200
                     
                     except Exception as e:
                         logger.error(f"Error saving order: {e}")
-                        error_msg = "માફ કરશો, ઓર્ડર સેવ કરવામાં સમસ્યા આવી.\n\nSorry, there was an issue saving your order. Please try again."
-                        send_whatsapp_message(phone_number, error_msg)
+                        send_whatsapp_message(phone_number, ORDER_SAVE_FAILED_PAYLOAD)
                         return jsonify({"status": "error"}), 500
                 else:
                     # User wants to make corrections
-                    response = "કૃપા કરીને સુધારેલી વિગતો આપો.\n\nPlease provide the corrected details."
-                    send_whatsapp_message(phone_number, response)
+                    send_whatsapp_message(phone_number, ASK_CORRECTIONS_PAYLOAD)
                     return jsonify({"status": "success"}), 200
             
             # Extract name or address from user's response
@@ -978,8 +1013,7 @@ We will contact you soon!
                 logger.info(f"✅ Name collected: {user_order.customer_name}")
                 
                 # Ask for address next
-                response = "તમારું સરનામું શું છે?\n\nPlease provide your delivery address."
-                send_whatsapp_message(phone_number, response)
+                send_whatsapp_message(phone_number, ASK_ADDRESS_PAYLOAD)
                 return jsonify({"status": "success"}), 200
             
             elif not user_order.address:
@@ -990,19 +1024,7 @@ We will contact you soon!
                 # All details collected, show summary
                 orchestrator.set_user_state(phone_number, orchestrator.ConversationState.AWAITING_FINAL_CONFIRMATION)
                 
-                summary = f"""✅ તમારા ઓર્ડરની વિગતો / Your Order Details:
-
-📦 Product: {user_order.product_name or 'N/A'}
-👤 Name: {user_order.customer_name}
-📱 Phone: {user_order.phone_number}
-📍 Address: {user_order.address}
-
-શું તમે આ ઓર્ડર કન્ફર્મ કરવા માંગો છો?
-Do you want to confirm this order?
-
-Type "yes" to confirm or provide corrections."""
-                
-                send_whatsapp_message(phone_number, summary)
+                send_whatsapp_message(phone_number, user_order.summary_message())
                 return jsonify({"status": "success"}), 200
         
         # Classify intent using backend AI
@@ -1191,12 +1213,12 @@ Please check Google Sheet for full details."""
                     
             except Exception as e:
                 logger.error(f"❌ Error saving order: {e}", exc_info=True)
-                error_msg = "માફ કરશો, ઓર્ડર સેવ કરવામાં સમસ્યા આવી.\n\nSorry, there was an issue saving your order. Please try again."
-                send_whatsapp_message(phone_number, error_msg)
+                send_whatsapp_message(phone_number, ORDER_SAVE_FAILED_PAYLOAD)
                 return jsonify({"status": "error", "message": str(e)}), 500
         
         else:
-            # Default AI chat
+            # Default AI chat (user sees "typing..." while Gemini generates)
+            send_typing_indicator(phone_number)
             response = orchestrator.handle_general_chat(phone_number, conversation, history)
             send_whatsapp_message(phone_number, response)
             
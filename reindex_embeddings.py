@@ -2,7 +2,10 @@
 import os
 import time
 import logging
-from pymongo import MongoClient
+import numpy as np
+from bson.binary import Binary
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
 import google.generativeai as genai
 from dotenv import load_dotenv
 
@@ -16,6 +19,69 @@ logger = logging.getLogger(__name__)
 MONGODB_URI = os.getenv("MONGODB_URI")
 DB_NAME = os.getenv("MONGODB_DB", "watchvine_refined")
 GOOGLE_API_KEY = os.getenv("Google_api")
+# Products embedded per embed_content call (the API accepts up to 100 texts per request)
+EMBED_BATCH_SIZE = 100
+# Also store an int8 copy of each embedding (text_embedding_i8 + text_embedding_scale), an eighth
+# of the float vector's size; the float field stays until readers have moved over
+STORE_INT8_EMBEDDINGS = os.getenv("STORE_INT8_EMBEDDINGS") == "1"
+
+def quantize_int8(embedding):
+    """Symmetric int8 quantization: (768 int8 bytes, scale) with embedding ~= int8 values * scale"""
+    vector = np.asarray(embedding, dtype=np.float32)
+    scale = float(np.abs(vector).max()) / 127 or 1.0
+    return np.rint(vector / scale).astype(np.int8).tobytes(), scale
+
+def embedding_fields(embedding):
+    """Fields written for one product's embedding"""
+    fields = {"text_embedding": embedding}
+    if STORE_INT8_EMBEDDINGS:
+        quantized, scale = quantize_int8(embedding)
+        fields["text_embedding_i8"] = Binary(quantized)
+        fields["text_embedding_scale"] = scale
+    return fields
+
+def searchable_text(product):
+    """Text embedded for a product"""
+    text_parts = [
+        product.get('name', ''),
+        product.get('brand', ''),
+        product.get('category', ''),
+        product.get('description', ''),
+        ' '.join(product.get('colors', [])),
+        ' '.join(product.get('styles', [])),
+        ' '.join(product.get('materials', [])),
+        product.get('searchable_text', '')
+    ]
+    return ' '.join(filter(None, text_parts)).strip()[:9000] # Limit length
+
+def embed_documents(content):
+    """768-dimension document embedding(s) for one text or a list of texts, in one embed_content call"""
+    result = genai.embed_content(
+        model="models/gemini-embedding-001",
+        content=content,
+        task_type="retrieval_document",
+        output_dimensionality=768
+    )
+    return result['embedding']
+
+def embed_batch(batch):
+    """
+    Embeddings for a batch of (product, text) pairs, None for products that failed.
+    A failed batch call is retried one product at a time, so a bad text only costs itself.
+    """
+    try:
+        return embed_documents([text for _, text in batch])
+    except Exception as e:
+        logger.warning(f"Batch embedding failed, retrying {len(batch)} products one at a time: {e}")
+    
+    embeddings = []
+    for product, text in batch:
+        try:
+            embeddings.append(embed_documents(text))
+        except Exception as e:
+            logger.error(f"Failed to index product {product.get('name')}: {e}")
+            embeddings.append(None)
+    return embeddings
 
 def reindex_all_products():
     if not GOOGLE_API_KEY:
@@ -35,46 +101,51 @@ def reindex_all_products():
         
         success_count = 0
         
-        for i, product in enumerate(products):
+        # One embed_content call per batch instead of one per product
+        for start in range(0, total, EMBED_BATCH_SIZE):
+            # Texts are built per product, so a malformed product is skipped on its own
+            batch = []
+            for product in products[start:start + EMBED_BATCH_SIZE]:
+                try:
+                    text = searchable_text(product)
+                except Exception as e:
+                    logger.error(f"Failed to build text for product {product.get('name')}: {e}")
+                    continue
+                if not text:
+                    logger.warning(f"Skipping product {product.get('name')}: no text to embed")
+                    continue
+                batch.append((product, text))
+            if not batch:
+                continue
+            
+            # Generate NEW embeddings with 768 dimensions
+            embedded = [
+                (product, embedding)
+                for (product, _), embedding in zip(batch, embed_batch(batch))
+                if embedding is not None
+            ]
+            if not embedded:
+                time.sleep(2)
+                continue
+            updates = [
+                UpdateOne({"_id": product["_id"]}, {"$set": embedding_fields(embedding)})
+                for product, embedding in embedded
+            ]
+            
+            # Update products
             try:
-                # Create searchable text
-                text_parts = [
-                    product.get('name', ''),
-                    product.get('brand', ''),
-                    product.get('category', ''),
-                    product.get('description', ''),
-                    ' '.join(product.get('colors', [])),
-                    ' '.join(product.get('styles', [])),
-                    ' '.join(product.get('materials', [])),
-                    product.get('searchable_text', '')
-                ]
-                
-                searchable_text = ' '.join(filter(None, text_parts)).strip()[:9000] # Limit length
-                
-                # Generate NEW embedding with 768 dimensions
-                result = genai.embed_content(
-                    model="models/gemini-embedding-001",
-                    content=searchable_text,
-                    task_type="retrieval_document",
-                    output_dimensionality=768
-                )
-                
-                embedding = result['embedding']
-                
-                # Update product
-                collection.update_one(
-                    {"_id": product["_id"]},
-                    {"$set": {"text_embedding": embedding}}
-                )
-                
-                success_count += 1
-                if i % 10 == 0:
-                    logger.info(f"Processed {i+1}/{total} products...")
-                    time.sleep(1) # Rate limiting
-                    
+                collection.bulk_write(updates, ordered=False)
+                success_count += len(updates)
+            except BulkWriteError as e:
+                write_errors = e.details.get("writeErrors", [])
+                success_count += len(updates) - len(write_errors)
+                for error in write_errors:
+                    logger.error(f"Failed to save embedding for {embedded[error['index']][0].get('name')}: {error.get('errmsg')}")
             except Exception as e:
-                logger.error(f"Failed to index product {product.get('name')}: {e}")
-                time.sleep(2)
+                logger.error(f"Failed to save embeddings for products {start + 1}-{start + len(batch)}: {e}")
+            
+            logger.info(f"Processed {min(start + EMBED_BATCH_SIZE, total)}/{total} products...")
+            time.sleep(1) # Rate limiting
         
         logger.info(f"Successfully re-indexed {success_count}/{total} products.")
         
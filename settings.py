@@ -0,0 +1,37 @@
+"""
+Runtime Settings
+Environment configuration read once at startup (validated, immutable)
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Process-wide settings; build with Settings.from_env()"""
+    google_api_key: str
+    google_model: Optional[str]  # Raw google_model env value; each caller applies its own default
+    
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Read settings from the environment, failing fast on missing required values"""
+        api_key = os.environ.get("Google_api")
+        if not api_key:
+            raise RuntimeError("Google_api environment variable is not set")
+        return cls(
+            google_api_key=api_key,
+            google_model=os.environ.get("google_model") or None
+        )
+
+
+settings = Settings.from_env()
+
+# The only genai.configure call for the bot process
+genai.configure(api_key=settings.google_api_key)
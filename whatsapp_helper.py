@@ -4,9 +4,12 @@ Handles sending messages and media through Evolution API
 """
 
 import os
+import json
 import requests
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -23,6 +26,12 @@ HEADERS = {
     "Content-Type": "application/json"
 }
 
+# How long WhatsApp shows "typing..." after a presence update (cleared early when a message lands)
+TYPING_INDICATOR_MS = 8000
+
+# Presence updates are fire-and-forget so they never delay the reply itself
+_presence_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="whatsapp-presence")
+
 def clean_phone_number(phone_number: str) -> str:
     """Clean and format phone number"""
     phone = phone_number.replace("+", "").replace("-", "").replace(" ", "")
@@ -30,19 +39,26 @@ def clean_phone_number(phone_number: str) -> str:
         phone = "91" + phone
     return phone
 
-def send_whatsapp_message(phone_number: str, message: str, max_retries: int = 3) -> bool:
-    """Send a text message via Evolution API with retry logic"""
+def prepare_whatsapp_text(message: str) -> bytes:
+    """
+    JSON-encode a fixed message once (UTF-8 bytes) so send_whatsapp_message can reuse it
+    without re-encoding the text on every send
+    """
+    return json.dumps(message, ensure_ascii=False).encode("utf-8")
+
+def send_whatsapp_message(phone_number: str, message: Union[str, bytes], max_retries: int = 3) -> bool:
+    """Send a text message via Evolution API with retry logic (message may be prepare_whatsapp_text bytes)"""
     phone = clean_phone_number(phone_number)
     url = f"{EVOLUTION_API_URL}/message/sendText/{INSTANCE_NAME}"
     
-    payload = {
-        "number": phone,
-        "text": message
-    }
+    if isinstance(message, bytes):
+        body = b'{"number": %s, "text": %s}' % (json.dumps(phone).encode("utf-8"), message)
+    else:
+        body = json.dumps({"number": phone, "text": message}, ensure_ascii=False).encode("utf-8")
     
     for attempt in range(max_retries):
         try:
-            response = requests.post(url, json=payload, headers=HEADERS, timeout=15)
+            response = requests.post(url, data=body, headers=HEADERS, timeout=15)
             if response.status_code in [200, 201]:
                 logger.info(f"✅ Message sent to {phone_number}")
                 return True
@@ -57,6 +73,25 @@ def send_whatsapp_message(phone_number: str, message: str, max_retries: int = 3)
     logger.error(f"❌ Failed to send message after {max_retries} attempts")
     return False
 
+def _post_presence(phone: str, presence: str, delay_ms: int):
+    """Single-attempt presence update (best effort)"""
+    url = f"{EVOLUTION_API_URL}/chat/sendPresence/{INSTANCE_NAME}"
+    payload = {
+        "number": phone,
+        "presence": presence,
+        "delay": delay_ms
+    }
+    try:
+        response = requests.post(url, json=payload, headers=HEADERS, timeout=5)
+        if response.status_code not in [200, 201]:
+            logger.debug(f"Presence update failed: {response.status_code}")
+    except Exception as e:
+        logger.debug(f"Presence update error: {e}")
+
+def send_typing_indicator(phone_number: str, delay_ms: int = TYPING_INDICATOR_MS):
+    """Show "typing..." to the user while a reply is being generated (returns immediately)"""
+    _presence_pool.submit(_post_presence, clean_phone_number(phone_number), "composing", delay_ms)
+
 def send_whatsapp_media(phone_number: str, media_url: str, caption: str = "", media_type: str = "image", max_retries: int = 3) -> bool:
     """Send media (image/video) via Evolution API using URL"""
     phone = clean_phone_number(phone_number)